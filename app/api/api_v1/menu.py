@@ -1,19 +1,85 @@
-import pickle
-
-from fastapi import APIRouter, Depends, HTTPException, status
-from redis import Redis
-from sqlalchemy.orm import Session
+from collections.abc import Awaitable, Callable, Iterable
+from contextlib import asynccontextmanager
+from functools import partial
+from uuid import UUID
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from redis.asyncio import Redis
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, models, schemas
-from app.database import get_db
+from app.bulk import menus_import_body, read_menus_import
+from app.cache import (
+    MENUS_KEY,
+    MENUS_VERSION,
+    TREE_VERSION,
+    Build,
+    get_or_build,
+    invalidate,
+    menu_key,
+    menu_tree_key,
+    menu_tree_version,
+    menu_version,
+    submenu_key,
+    submenu_version,
+)
+from app.config import settings
+from app.database import get_db, released
+from app.export import MEDIA_TYPES, RENDERERS, ExportFormat
+from app.pagination import Page
 from app.redis import get_redis
 
 MENU_NOT_F = "menu not found"
 SUBMENU_NOT_F = "submenu not found"
 DISH_NOT_F = "dish not found"
 TITLE_REGISTERED = "Title already registered"
+UNIQUE_VIOLATION = "23505"
+FOREIGN_KEY_VIOLATION = "23503"
+# Lists are refreshed in the unpaginated variant only.
+WHOLE_LIST = Page(limit=None, cursor=None)
+
+# Ids are embedded in the cache keys, so only those of the form given by
+# crud are looked up: braces would move the keys to another hash tag.
+PATH_IDS = {
+    "menu_id": MENU_NOT_F,
+    "submenu_id": SUBMENU_NOT_F,
+    "dish_id": DISH_NOT_F,
+}
+
+
+def is_id(value: str) -> bool:
+    try:
+        return str(UUID(value)) == value
+    except ValueError:
+        return False
+
+
+async def check_path_ids(request: Request) -> None:
+    for name, detail in PATH_IDS.items():
+        value = request.path_params.get(name)
+        if value is None or is_id(value):
+            continue
+        # The dishes of a missing submenu are an empty list.
+        if name == "submenu_id" and request.scope["endpoint"] is read_dishes:
+            continue
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=detail,
+        )
 
-router = APIRouter()
+
+router = APIRouter(dependencies=[Depends(check_path_ids)])
 
 
 @router.get(
@@ -24,15 +90,58 @@ router = APIRouter()
     status_code=status.HTTP_200_OK,
     tags=["Меню"],
 )
-def read_menus(
-    db: Session = Depends(get_db),
+async def read_menus(
+    page: Page = Depends(),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get("menus"):
-        return pickle.loads(cache_data)
-    result = crud.get_all_menu(db=db)
-    cache.set("menus", pickle.dumps(result))
-    return result
+    async def build():
+        result, headers = page.paginate(
+            await crud.get_all_menu(
+                db=db,
+                limit=page.fetch_limit,
+                after=page.after,
+            ),
+        )
+        return [schemas.Menu.from_orm(db_menu) for db_menu in result], headers
+
+    return await get_or_build(
+        cache,
+        MENUS_KEY,
+        released(db, build),
+        versions=[MENUS_VERSION],
+        variant=page.variant,
+        ttl=settings.CACHE_TTL_MENU,
+        if_none_match=if_none_match,
+    )
+
+
+@router.get(
+    path="/tree",
+    response_model=list[schemas.MenuTree],
+    responses=schemas.menus_tree_response_example,
+    summary="Список меню со всеми подменю и блюдами",
+    status_code=status.HTTP_200_OK,
+    tags=["Меню"],
+)
+async def read_menus_tree(
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
+    cache: Redis = Depends(get_redis),
+):
+    async def build():
+        result = await crud.get_all_menu_tree(db=db)
+        return [schemas.MenuTree.from_orm(db_menu) for db_menu in result], None
+
+    return await get_or_build(
+        cache,
+        f"{MENUS_KEY}:tree",
+        released(db, build),
+        versions=[TREE_VERSION],
+        ttl=settings.CACHE_TTL_MENU,
+        if_none_match=if_none_match,
+    )
 
 
 @router.post(
@@ -43,19 +152,77 @@ def read_menus(
     status_code=status.HTTP_201_CREATED,
     tags=["Меню"],
 )
-def create_menu(
+async def create_menu(
     menu: schemas.MenuCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_menu = crud.get_menu_by_title(db, title=menu.title)
-    if db_menu:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=TITLE_REGISTERED,
+    async with unique_title(db):
+        db_menu = await crud.create_menu(db=db, menu=menu)
+    await invalidate(cache, MENUS_VERSION, TREE_VERSION)
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_menu(
+            cache,
+            db_menu.id,
+            reloaded(db, db_menu, schemas.Menu),
+        )
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(read_menus, page=WHOLE_LIST),
         )
-    cache.delete("menus")
-    return crud.create_menu(db=db, menu=menu)
+    return db_menu
+
+
+@router.post(
+    path="/bulk",
+    response_model=list[schemas.Menu],
+    responses=schemas.menus_import_response_example,
+    summary="Загрузить меню со всеми подменю и блюдами",
+    description=(
+        "Принимает массив JSON или NDJSON (`application/x-ndjson`, "
+        "по одному меню в строке). Загрузка выполняется в одной "
+        "транзакции: при ошибке не сохраняется ничего."
+    ),
+    status_code=status.HTTP_201_CREATED,
+    tags=["Меню"],
+    openapi_extra=menus_import_body,
+)
+async def import_menus(
+    menus: list[schemas.MenuImport] = Depends(read_menus_import),
+    db: AsyncSession = Depends(get_db),
+    cache: Redis = Depends(get_redis),
+):
+    async with unique_title(db):
+        db_menus = await crud.import_menus(db=db, menus=menus)
+    await invalidate(cache, MENUS_VERSION, TREE_VERSION)
+    return db_menus
+
+
+@router.get(
+    path="/export",
+    response_class=StreamingResponse,
+    responses=schemas.menus_export_response_example,
+    summary="Выгрузить все меню, подменю и блюда",
+    status_code=status.HTTP_200_OK,
+    tags=["Меню"],
+)
+async def export_menus(
+    format: ExportFormat = Query(
+        default=ExportFormat.ndjson,
+        title="Формат выгрузки",
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    rows = crud.stream_catalog(db=db, chunk_size=settings.EXPORT_CHUNK_SIZE)
+    filename = f"menus.{format.value}"
+    return StreamingResponse(
+        RENDERERS[format](rows),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get(
@@ -66,16 +233,55 @@ def create_menu(
     status_code=status.HTTP_200_OK,
     tags=["Меню"],
 )
-def read_menu(
+async def read_menu(
     menu_id: str,
-    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get(f"menu:{menu_id}"):
-        return pickle.loads(cache_data)
-    result = get_menu_or_404(menu_id=menu_id, db=db)
-    cache.set(f"menu:{menu_id}", pickle.dumps(result))
-    return result
+    async def build():
+        result = await get_menu_or_404(menu_id=menu_id, db=db)
+        return schemas.Menu.from_orm(result), None
+
+    return await get_or_build_menu(
+        cache,
+        menu_id,
+        released(db, build),
+        if_none_match,
+    )
+
+
+@router.get(
+    path="/{menu_id}/tree",
+    response_model=schemas.MenuTree,
+    responses=schemas.menu_tree_response_example,
+    summary="Конкретное меню со всеми подменю и блюдами",
+    status_code=status.HTTP_200_OK,
+    tags=["Меню"],
+)
+async def read_menu_tree(
+    menu_id: str,
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
+    cache: Redis = Depends(get_redis),
+):
+    async def build():
+        result = await crud.get_menu_tree(db=db, menu_id=menu_id)
+        if result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=MENU_NOT_F,
+            )
+        return schemas.MenuTree.from_orm(result), None
+
+    return await get_or_build(
+        cache,
+        menu_tree_key(menu_id),
+        released(db, build),
+        versions=[menu_version(menu_id), menu_tree_version(menu_id)],
+        ttl=settings.CACHE_TTL_MENU,
+        if_none_match=if_none_match,
+    )
 
 
 @router.patch(
@@ -86,16 +292,35 @@ def read_menu(
     status_code=status.HTTP_200_OK,
     tags=["Меню"],
 )
-def update_menu(
+async def update_menu(
     menu_id: str,
     menu: schemas.MenuCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    cache.delete(f"menu:{menu_id}")
-    cache.delete("menus")
-    return crud.patch_menu(db=db, db_menu=db_menu, menu=menu)
+    db_menu = await get_menu_or_404(menu_id=menu_id, db=db)
+    async with unique_title(db):
+        db_menu = await crud.patch_menu(db=db, db_menu=db_menu, menu=menu)
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        menu_version(menu_id),
+    )
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_menu(
+            cache,
+            menu_id,
+            reloaded(db, db_menu, schemas.Menu),
+        )
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(read_menus, page=WHOLE_LIST),
+        )
+    return db_menu
 
 
 @router.delete(
@@ -105,18 +330,28 @@ def update_menu(
     status_code=status.HTTP_200_OK,
     tags=["Меню"],
 )
-def delete_menu(
+async def delete_menu(
     menu_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    cache.delete("menus")
-    cache.delete(f"menu:{menu_id}")
-    cache.delete(f"menu:{menu_id}:submenus")
-    delete_cache_values(f"menu:{menu_id}:submenu.list", cache)
-    delete_cache_values(f"menu:{menu_id}:dish.list", cache)
-    return crud.delete_menu(db_menu=db_menu, db=db)
+    db_menu = await get_menu_or_404(menu_id=menu_id, db=db)
+    submenu_ids = await crud.get_submenu_ids(db=db, db_menu=db_menu)
+    result = await crud.delete_menu(db_menu=db_menu, db=db)
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        deleted=[
+            menu_version(menu_id),
+            menu_tree_version(menu_id),
+            *(
+                submenu_version(menu_id, submenu_id)
+                for submenu_id in submenu_ids
+            ),
+        ],
+    )
+    return result
 
 
 @router.get(
@@ -127,17 +362,36 @@ def delete_menu(
     status_code=status.HTTP_200_OK,
     tags=["Подменю"],
 )
-def read_submenus(
+async def read_submenus(
     menu_id: str,
-    db: Session = Depends(get_db),
+    page: Page = Depends(),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get(f"menu:{menu_id}:submenus"):
-        return pickle.loads(cache_data)
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    result = crud.get_all_submenu(db_menu=db_menu)
-    cache.set(f"menu:{menu_id}:submenus", pickle.dumps(result))
-    return result
+    async def build():
+        db_menu = await get_menu_or_404(menu_id=menu_id, db=db)
+        result, headers = page.paginate(
+            await crud.get_all_submenu(
+                db=db,
+                db_menu=db_menu,
+                limit=page.fetch_limit,
+                after=page.after,
+            ),
+        )
+        return [
+            schemas.SubMenu.from_orm(db_submenu) for db_submenu in result
+        ], headers
+
+    return await get_or_build(
+        cache,
+        f"{menu_key(menu_id)}:submenus",
+        released(db, build),
+        versions=[menu_version(menu_id)],
+        variant=page.variant,
+        ttl=settings.CACHE_TTL_SUBMENU,
+        if_none_match=if_none_match,
+    )
 
 
 @router.post(
@@ -148,21 +402,46 @@ def read_submenus(
     status_code=status.HTTP_201_CREATED,
     tags=["Подменю"],
 )
-def create_submenu(
+async def create_submenu(
     menu_id: str,
     submenu: schemas.SubMenuCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    db_submenu = crud.get_submenu_by_title(db, title=submenu.title)
-    if db_submenu:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=TITLE_REGISTERED,
+    db_menu = await get_menu_or_404(menu_id=menu_id, db=db)
+    async with unique_title(db, parent_not_found=MENU_NOT_F):
+        db_submenu = await crud.create_submenu(
+            db=db,
+            db_menu=db_menu,
+            submenu=submenu,
+        )
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        menu_version(menu_id),
+    )
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_submenu(
+            cache,
+            menu_id,
+            db_submenu.id,
+            reloaded(db, db_submenu, schemas.SubMenu),
+        )
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(
+                read_submenus,
+                menu_id=menu_id,
+                page=WHOLE_LIST,
+            ),
+            partial(read_menu, menu_id=menu_id),
+            partial(read_menus, page=WHOLE_LIST),
         )
-    cache.delete(f"menu:{menu_id}:submenus")
-    return crud.create_submenu(db=db, db_menu=db_menu, submenu=submenu)
+    return db_submenu
 
 
 @router.get(
@@ -173,18 +452,28 @@ def create_submenu(
     status_code=status.HTTP_200_OK,
     tags=["Подменю"],
 )
-def read_submenu(
+async def read_submenu(
     menu_id: str,
     submenu_id: str,
-    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get(f"submenu:{submenu_id}"):
-        return pickle.loads(cache_data)
-    result = get_submenu_or_404(menu_id=menu_id, submenu_id=submenu_id, db=db)
-    cache.set(f"submenu:{submenu_id}", pickle.dumps(result))
-    cache.rpush(f"menu:{menu_id}:submenu.list", f"submenu:{submenu_id}")
-    return result
+    async def build():
+        result = await get_submenu_or_404(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            db=db,
+        )
+        return schemas.SubMenu.from_orm(result), None
+
+    return await get_or_build_submenu(
+        cache,
+        menu_id,
+        submenu_id,
+        released(db, build),
+        if_none_match,
+    )
 
 
 @router.patch(
@@ -195,21 +484,45 @@ def read_submenu(
     status_code=status.HTTP_200_OK,
     tags=["Подменю"],
 )
-def update_submenu(
+async def update_submenu(
     menu_id: str,
     submenu_id: str,
     submenu: schemas.MenuCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_submenu = get_submenu_or_404(
+    db_submenu = await get_submenu_or_404(
         menu_id=menu_id,
         submenu_id=submenu_id,
         db=db,
     )
-    cache.delete(f"submenu:{submenu_id}")
-    cache.delete(f"menu:{menu_id}:submenus")
-    return crud.patch_submenu(db=db, db_submenu=db_submenu, submenu=submenu)
+    async with unique_title(db):
+        db_submenu = await crud.patch_submenu(
+            db=db,
+            db_submenu=db_submenu,
+            submenu=submenu,
+        )
+    # Menu lists show the counts only, which stay as they are.
+    await invalidate(cache, TREE_VERSION, menu_version(menu_id))
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_submenu(
+            cache,
+            menu_id,
+            submenu_id,
+            reloaded(db, db_submenu, schemas.SubMenu),
+        )
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(
+                read_submenus,
+                menu_id=menu_id,
+                page=WHOLE_LIST,
+            ),
+        )
+    return db_submenu
 
 
 @router.delete(
@@ -219,25 +532,30 @@ def update_submenu(
     status_code=status.HTTP_200_OK,
     tags=["Подменю"],
 )
-def delete_submenu(
+async def delete_submenu(
     menu_id: str,
     submenu_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_submenu = get_submenu_or_404(
+    db_menu, db_submenu, _ = await get_path_or_404(
+        db,
         menu_id=menu_id,
         submenu_id=submenu_id,
+    )
+    result = await crud.delete_submenu(
         db=db,
+        db_menu=db_menu,
+        db_submenu=db_submenu,
     )
-    cache.delete(f"submenu:{submenu_id}")
-    cache.delete(f"menu:{menu_id}")
-    cache.delete(f"menu:{menu_id}:submenus")
-    cache.delete(f"submenu:{submenu_id}:dishes")
-
-    delete_cache_values(f"submenu:{submenu_id}:dish.list", cache)
-    cache.delete("menus")
-    return crud.delete_submenu(db_submenu=db_submenu, db=db)
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        menu_version(menu_id),
+        deleted=[submenu_version(menu_id, submenu_id)],
+    )
+    return result
 
 
 @router.get(
@@ -248,24 +566,42 @@ def delete_submenu(
     status_code=status.HTTP_200_OK,
     tags=["Блюдо"],
 )
-def read_dishes(
+async def read_dishes(
     menu_id: str,
     submenu_id: str,
-    db: Session = Depends(get_db),
+    page: Page = Depends(),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get(f"submenu:{submenu_id}:dishes"):
-        return pickle.loads(cache_data)
-    db_submenu = get_submenu_or_none(
-        menu_id=menu_id,
-        submenu_id=submenu_id,
-        db=db,
+    async def build():
+        db_submenu = await get_submenu_or_none(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            db=db,
+        )
+        if db_submenu is None:
+            return [], None
+        result, headers = page.paginate(
+            await crud.get_all_dish(
+                db=db,
+                db_submenu=db_submenu,
+                limit=page.fetch_limit,
+                after=page.after,
+            ),
+        )
+        return [schemas.Dish.from_orm(db_dish) for db_dish in result], headers
+
+    return await get_or_build(
+        cache,
+        f"{submenu_key(menu_id, submenu_id)}:dishes",
+        released(db, build),
+        versions=[menu_version(menu_id), submenu_version(menu_id, submenu_id)],
+        # Other ids are let through by check_path_ids, but never cached.
+        variant=page.variant if is_id(submenu_id) else None,
+        ttl=settings.CACHE_TTL_DISH,
+        if_none_match=if_none_match,
     )
-    if db_submenu is None:
-        return []
-    result = crud.get_all_dish(db_submenu=db_submenu)
-    cache.set(f"submenu:{submenu_id}:dishes", pickle.dumps(result))
-    return result
 
 
 @router.post(
@@ -276,33 +612,60 @@ def read_dishes(
     status_code=status.HTTP_201_CREATED,
     tags=["Блюдо"],
 )
-def create_dish(
+async def create_dish(
     menu_id: str,
     submenu_id: str,
     dish: schemas.DishCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_submenu = get_submenu_or_404(
+    db_menu, db_submenu, _ = await get_path_or_404(
+        db,
         menu_id=menu_id,
         submenu_id=submenu_id,
-        db=db,
     )
-    db_dish = crud.get_dish_by_title(
-        db,
-        db_submenu=db_submenu,
-        title=dish.title,
+    async with unique_title(db, parent_not_found=SUBMENU_NOT_F):
+        db_dish = await crud.create_dish(
+            db=db,
+            db_menu=db_menu,
+            db_submenu=db_submenu,
+            dish=dish,
+        )
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        menu_version(menu_id),
     )
-    if db_dish:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=TITLE_REGISTERED,
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_dish(
+            cache,
+            menu_id,
+            submenu_id,
+            db_dish.id,
+            reloaded(db, db_dish, schemas.Dish),
         )
-    cache.delete(f"submenu:{submenu_id}:dishes")
-    cache.delete(f"submenu:{submenu_id}")
-    cache.delete(f"menu:{menu_id}")
-
-    return crud.create_dish(db=db, db_submenu=db_submenu, dish=dish)
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(
+                read_dishes,
+                menu_id=menu_id,
+                submenu_id=submenu_id,
+                page=WHOLE_LIST,
+            ),
+            partial(read_submenu, menu_id=menu_id, submenu_id=submenu_id),
+            partial(
+                read_submenus,
+                menu_id=menu_id,
+                page=WHOLE_LIST,
+            ),
+            partial(read_menu, menu_id=menu_id),
+            partial(read_menus, page=WHOLE_LIST),
+        )
+    return db_dish
 
 
 @router.get(
@@ -313,25 +676,31 @@ def create_dish(
     status_code=status.HTTP_200_OK,
     tags=["Блюдо"],
 )
-def read_dish(
+async def read_dish(
     menu_id: str,
     submenu_id: str,
     dish_id: str,
-    db: Session = Depends(get_db),
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    if cache_data := cache.get(f"dish:{dish_id}"):
-        return pickle.loads(cache_data)
-    result = get_dish_or_404(
-        menu_id=menu_id,
-        submenu_id=submenu_id,
-        dish_id=dish_id,
-        db=db,
+    async def build():
+        result = await get_dish_or_404(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            dish_id=dish_id,
+            db=db,
+        )
+        return schemas.Dish.from_orm(result), None
+
+    return await get_or_build_dish(
+        cache,
+        menu_id,
+        submenu_id,
+        dish_id,
+        released(db, build),
+        if_none_match,
     )
-    cache.set(f"dish:{dish_id}", pickle.dumps(result))
-    cache.rpush(f"menu:{menu_id}:dish.list", f"dish:{dish_id}")
-    cache.rpush(f"submenu:{submenu_id}:dish.list", f"dish:{dish_id}")
-    return result
 
 
 @router.patch(
@@ -342,23 +711,49 @@ def read_dish(
     status_code=status.HTTP_200_OK,
     tags=["Блюдо"],
 )
-def update_dish(
+async def update_dish(
     menu_id: str,
     submenu_id: str,
     dish_id: str,
     dish: schemas.DishCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_dish = get_dish_or_404(
+    db_dish = await get_dish_or_404(
         menu_id=menu_id,
         submenu_id=submenu_id,
         dish_id=dish_id,
         db=db,
     )
-    cache.delete(f"submenu:{submenu_id}:dishes")
-    cache.delete(f"dish:{dish_id}")
-    return crud.patch_dish(db=db, db_dish=db_dish, dish=dish)
+    async with unique_title(db):
+        db_dish = await crud.patch_dish(db=db, db_dish=db_dish, dish=dish)
+    await invalidate(
+        cache,
+        TREE_VERSION,
+        menu_tree_version(menu_id),
+        submenu_version(menu_id, submenu_id),
+    )
+    if settings.CACHE_WRITE_THROUGH:
+        await get_or_build_dish(
+            cache,
+            menu_id,
+            submenu_id,
+            dish_id,
+            reloaded(db, db_dish, schemas.Dish),
+        )
+        write_through(
+            background_tasks,
+            db,
+            cache,
+            partial(
+                read_dishes,
+                menu_id=menu_id,
+                submenu_id=submenu_id,
+                page=WHOLE_LIST,
+            ),
+        )
+    return db_dish
 
 
 @router.delete(
@@ -368,29 +763,36 @@ def update_dish(
     status_code=status.HTTP_200_OK,
     tags=["Блюдо"],
 )
-def delete_dish(
+async def delete_dish(
     menu_id: str,
     submenu_id: str,
     dish_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     cache: Redis = Depends(get_redis),
 ):
-    db_dish = get_dish_or_404(
+    db_menu, db_submenu, db_dish = await get_path_or_404(
+        db,
         menu_id=menu_id,
         submenu_id=submenu_id,
         dish_id=dish_id,
+    )
+    result = await crud.delete_dish(
         db=db,
+        db_menu=db_menu,
+        db_submenu=db_submenu,
+        db_dish=db_dish,
     )
-    cache.delete(f"dish:{dish_id}")
-    cache.delete(f"submenu:{submenu_id}:dishes")
-    cache.delete(f"submenu:{submenu_id}")
-    cache.delete(f"menu:{menu_id}")
-    cache.delete("menus")
-    return crud.delete_dish(db_dish=db_dish, db=db)
+    await invalidate(
+        cache,
+        MENUS_VERSION,
+        TREE_VERSION,
+        menu_version(menu_id),
+    )
+    return result
 
 
-def get_menu_or_404(menu_id: str, db: Session):
-    menu = crud.get_menu_by_id(menu_id=menu_id, db=db)
+async def get_menu_or_404(menu_id: str, db: AsyncSession):
+    menu = await crud.get_menu_by_id(menu_id=menu_id, db=db)
     if menu:
         return menu
     raise HTTPException(
@@ -399,52 +801,187 @@ def get_menu_or_404(menu_id: str, db: Session):
     )
 
 
-def get_submenu_or_404(menu_id: str, submenu_id: str, db: Session):
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    db_submenu = crud.get_submenu_by_id(
+async def get_path_or_404(
+    db: AsyncSession,
+    menu_id: str,
+    submenu_id: str | None = None,
+    dish_id: str | None = None,
+) -> tuple[models.Menu, models.SubMenu | None, models.Dish | None]:
+    db_menu, db_submenu, db_dish = await crud.get_path(
         db,
-        menu=db_menu,
+        menu_id=menu_id,
         submenu_id=submenu_id,
+        dish_id=dish_id,
     )
-    if db_submenu:
-        return db_submenu
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail=SUBMENU_NOT_F,
+    if db_menu is None:
+        detail = MENU_NOT_F
+    elif submenu_id is not None and db_submenu is None:
+        detail = SUBMENU_NOT_F
+    elif dish_id is not None and db_dish is None:
+        detail = DISH_NOT_F
+    else:
+        return db_menu, db_submenu, db_dish
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+async def get_submenu_or_404(menu_id: str, submenu_id: str, db: AsyncSession):
+    _, db_submenu, _ = await get_path_or_404(
+        db,
+        menu_id=menu_id,
+        submenu_id=submenu_id,
     )
+    return db_submenu
 
 
-def get_submenu_or_none(
+async def get_submenu_or_none(
     menu_id: str,
     submenu_id: str,
-    db: Session,
+    db: AsyncSession,
 ) -> models.SubMenu | None:
-    db_menu = get_menu_or_404(menu_id=menu_id, db=db)
-    db_submenu = crud.get_submenu_by_id(
+    db_menu, db_submenu, _ = await crud.get_path(
         db,
-        menu=db_menu,
+        menu_id=menu_id,
         submenu_id=submenu_id,
     )
-    if db_submenu:
-        return db_submenu
-    return None
+    if db_menu is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=MENU_NOT_F,
+        )
+    return db_submenu
 
 
-def get_dish_or_404(menu_id: str, submenu_id: str, dish_id: str, db: Session):
-    db_submenu = get_submenu_or_404(
+async def get_dish_or_404(
+    menu_id: str,
+    submenu_id: str,
+    dish_id: str,
+    db: AsyncSession,
+):
+    _, _, db_dish = await get_path_or_404(
+        db,
         menu_id=menu_id,
         submenu_id=submenu_id,
-        db=db,
+        dish_id=dish_id,
     )
-    db_dish = crud.get_dish_by_id(db=db, submenu=db_submenu, dish_id=dish_id)
-    if db_dish:
-        return db_dish
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail=DISH_NOT_F,
+    return db_dish
+
+
+@asynccontextmanager
+async def unique_title(db: AsyncSession, parent_not_found: str | None = None):
+    # Unique indexes, the titles, make a conflict, and a parent deleted
+    # meanwhile is reported as one missing already, by parent_not_found.
+    # Other integrity errors are not the client's.
+    try:
+        yield
+    except IntegrityError as error:
+        await db.rollback()
+        sqlstate = getattr(error.orig, "sqlstate", None)
+        if sqlstate == FOREIGN_KEY_VIOLATION and parent_not_found:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=parent_not_found,
+            )
+        if sqlstate != UNIQUE_VIOLATION:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=TITLE_REGISTERED,
+        )
+
+
+async def get_or_build_menu(
+    cache: Redis,
+    menu_id: str,
+    build: Build,
+    if_none_match: str | None = None,
+):
+    return await get_or_build(
+        cache,
+        menu_key(menu_id),
+        build,
+        versions=[menu_version(menu_id)],
+        ttl=settings.CACHE_TTL_MENU,
+        if_none_match=if_none_match,
+    )
+
+
+async def get_or_build_submenu(
+    cache: Redis,
+    menu_id: str,
+    submenu_id: str,
+    build: Build,
+    if_none_match: str | None = None,
+):
+    return await get_or_build(
+        cache,
+        submenu_key(menu_id, submenu_id),
+        build,
+        versions=[menu_version(menu_id), submenu_version(menu_id, submenu_id)],
+        ttl=settings.CACHE_TTL_SUBMENU,
+        if_none_match=if_none_match,
+    )
+
+
+async def get_or_build_dish(
+    cache: Redis,
+    menu_id: str,
+    submenu_id: str,
+    dish_id: str,
+    build: Build,
+    if_none_match: str | None = None,
+):
+    return await get_or_build(
+        cache,
+        f"{submenu_key(menu_id, submenu_id)}:dish:{dish_id}",
+        build,
+        versions=[menu_version(menu_id), submenu_version(menu_id, submenu_id)],
+        ttl=settings.CACHE_TTL_DISH,
+        if_none_match=if_none_match,
     )
 
 
-def delete_cache_values(key_list: str, cache: Redis):
-    while value := cache.rpop(key_list):
-        cache.delete(value)
+def reloaded(
+    db: AsyncSession,
+    db_object: models.Menu | models.SubMenu | models.Dish,
+    schema: type[schemas.Menu | schemas.SubMenu | schemas.Dish],
+) -> Build:
+    """Build the cached response of db_object from its row read again.
+
+    The object as loaded for the write may be stale by now, e.g. its
+    counters or a concurrent update of it. Reading the row inside the
+    build, after the versions are read, leaves any write committed
+    meanwhile to bump them again.
+    """
+
+    async def build():
+        await db.refresh(db_object)
+        return schema.from_orm(db_object), None
+
+    return build
+
+
+async def refresh(
+    db: AsyncSession,
+    cache: Redis,
+    reads: Iterable[Callable[..., Awaitable]],
+) -> None:
+    """Rebuild the cached responses of read routes after a write.
+
+    Objects loaded by the write may hold counters changed concurrently,
+    so they are reloaded.
+    """
+    db.expire_all()
+    for read in reads:
+        try:
+            await read(if_none_match=None, db=db, cache=cache)
+        except HTTPException:
+            pass
+
+
+def write_through(
+    background_tasks: BackgroundTasks,
+    db: AsyncSession,
+    cache: Redis,
+    *reads: Callable[..., Awaitable],
+) -> None:
+    background_tasks.add_task(refresh, db, cache, reads)
@@ -0,0 +1,424 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from uuid import uuid4
+
+from fastapi import FastAPI, status
+from httpx import AsyncClient
+
+from app.main import app
+from app.metrics import cache_hits, cache_misses
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Config:
+    menus: int = 10
+    submenus: int = 5
+    dishes: int = 10
+    requests: int = 2000
+    concurrency: int = 10
+    write_ratio: float = 0.1
+    seed: int = 0
+    prefix: str = "/api/v1/menus"
+
+
+@dataclass
+class Catalog:
+    """Ids of the seeded objects and of the dishes created by the run."""
+
+    run: str
+    menus: list[str] = field(default_factory=list)
+    # (menu_id, submenu_id)
+    submenus: list[tuple[str, str]] = field(default_factory=list)
+    # (menu_id, submenu_id, dish_id)
+    dishes: list[tuple[str, str, str]] = field(default_factory=list)
+    created: list[tuple[str, str, str]] = field(default_factory=list)
+    writes: int = 0
+
+    def title(self, kind: str) -> str:
+        self.writes += 1
+        return f"{kind} {self.run} {self.writes}"
+
+
+# Method, route template, path and JSON body of a request.
+Request = tuple[str, str, str, dict | None]
+Operation = Callable[[Catalog, random.Random], Request]
+
+
+def read_menus(catalog: Catalog, rnd: random.Random) -> Request:
+    return "GET", "/", "/", None
+
+
+def read_menus_tree(catalog: Catalog, rnd: random.Random) -> Request:
+    return "GET", "/tree", "/tree", None
+
+
+def read_menu(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id = rnd.choice(catalog.menus)
+    return "GET", "/{menu_id}", f"/{menu_id}", None
+
+
+def read_menu_tree(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id = rnd.choice(catalog.menus)
+    return "GET", "/{menu_id}/tree", f"/{menu_id}/tree", None
+
+
+def read_submenus(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id = rnd.choice(catalog.menus)
+    return "GET", "/{menu_id}/submenus", f"/{menu_id}/submenus", None
+
+
+def read_submenu(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id = rnd.choice(catalog.submenus)
+    return (
+        "GET",
+        "/{menu_id}/submenus/{submenu_id}",
+        f"/{menu_id}/submenus/{submenu_id}",
+        None,
+    )
+
+
+def read_dishes(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id = rnd.choice(catalog.submenus)
+    return (
+        "GET",
+        "/{menu_id}/submenus/{submenu_id}/dishes",
+        f"/{menu_id}/submenus/{submenu_id}/dishes",
+        None,
+    )
+
+
+def read_dish(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id, dish_id = rnd.choice(catalog.dishes)
+    return (
+        "GET",
+        "/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        None,
+    )
+
+
+def patch_menu(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id = rnd.choice(catalog.menus)
+    return (
+        "PATCH",
+        "/{menu_id}",
+        f"/{menu_id}",
+        {"title": catalog.title("Menu"), "description": "Benchmark"},
+    )
+
+
+def patch_submenu(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id = rnd.choice(catalog.submenus)
+    return (
+        "PATCH",
+        "/{menu_id}/submenus/{submenu_id}",
+        f"/{menu_id}/submenus/{submenu_id}",
+        {"title": catalog.title("Submenu"), "description": "Benchmark"},
+    )
+
+
+def patch_dish(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id, dish_id = rnd.choice(catalog.dishes)
+    return (
+        "PATCH",
+        "/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        {
+            "title": catalog.title("Dish"),
+            "description": "Benchmark",
+            "price": f"{rnd.randint(100, 999)}.50",
+        },
+    )
+
+
+def create_dish(catalog: Catalog, rnd: random.Random) -> Request:
+    menu_id, submenu_id = rnd.choice(catalog.submenus)
+    return (
+        "POST",
+        "/{menu_id}/submenus/{submenu_id}/dishes",
+        f"/{menu_id}/submenus/{submenu_id}/dishes",
+        {
+            "title": catalog.title("Dish"),
+            "description": "Benchmark",
+            "price": "100.50",
+        },
+    )
+
+
+def delete_dish(catalog: Catalog, rnd: random.Random) -> Request:
+    if not catalog.created:
+        return create_dish(catalog, rnd)
+    menu_id, submenu_id, dish_id = catalog.created.pop()
+    return (
+        "DELETE",
+        "/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        None,
+    )
+
+
+# Relative frequencies of the operations of a read-mostly client.
+READS: dict[Operation, int] = {
+    read_menus: 10,
+    read_menus_tree: 2,
+    read_menu: 15,
+    read_menu_tree: 3,
+    read_submenus: 10,
+    read_submenu: 15,
+    read_dishes: 20,
+    read_dish: 25,
+}
+WRITES: dict[Operation, int] = {
+    patch_menu: 1,
+    patch_submenu: 2,
+    patch_dish: 4,
+    create_dish: 2,
+    delete_dish: 2,
+}
+
+
+def choose(catalog: Catalog, rnd: random.Random, config: Config) -> Request:
+    operations = WRITES if rnd.random() < config.write_ratio else READS
+    operation = rnd.choices(list(operations), list(operations.values()))[0]
+    return operation(catalog, rnd)
+
+
+def seed_body(config: Config, run: str) -> list[dict]:
+    return [
+        {
+            "title": f"Menu {run} {i_menu}",
+            "description": "Benchmark",
+            "submenus": [
+                {
+                    "title": f"Submenu {i_submenu}",
+                    "description": "Benchmark",
+                    "dishes": [
+                        {
+                            "title": f"Dish {i_dish}",
+                            "description": "Benchmark",
+                            "price": "100.50",
+                        }
+                        for i_dish in range(config.dishes)
+                    ],
+                }
+                for i_submenu in range(config.submenus)
+            ],
+        }
+        for i_menu in range(config.menus)
+    ]
+
+
+async def seed(client: AsyncClient, config: Config) -> Catalog:
+    """Import the catalog and read its ids back from the export."""
+    catalog = Catalog(run=uuid4().hex[:8])
+    response = await client.post("/bulk", json=seed_body(config, catalog.run))
+    response.raise_for_status()
+    catalog.menus = [menu["id"] for menu in response.json()]
+    seeded = set(catalog.menus)
+    response = await client.get("/export", params={"format": "ndjson"})
+    for line in response.text.splitlines():
+        menu = json.loads(line)
+        if menu["id"] not in seeded:
+            continue
+        for submenu in menu["submenus"]:
+            catalog.submenus.append((menu["id"], submenu["id"]))
+            catalog.dishes.extend(
+                (menu["id"], submenu["id"], dish["id"])
+                for dish in submenu["dishes"]
+            )
+    return catalog
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    if len(latencies) < 2:
+        return {f"p{p}": latencies[0] if latencies else 0 for p in PERCENTILES}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {f"p{p}": cuts[p - 1] for p in PERCENTILES}
+
+
+def cache_totals() -> tuple[float, float]:
+    return sum(cache_hits.values.values()), sum(cache_misses.values.values())
+
+
+async def replay(
+    client: AsyncClient,
+    catalog: Catalog,
+    config: Config,
+) -> dict[str, list[float]]:
+    """Send config.requests requests from config.concurrency clients.
+
+    Returns the latencies in seconds by route, errors under "errors".
+    """
+    rnd = random.Random(config.seed)
+    # Chosen when sent, so only dishes already created get deleted.
+    requests = (choose(catalog, rnd, config) for _ in range(config.requests))
+    latencies: dict[str, list[float]] = {"errors": []}
+
+    async def worker() -> None:
+        for method, route, path, body in requests:
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latency = time.perf_counter() - started
+            latencies.setdefault(f"{method} {route}", []).append(latency)
+            if response.status_code >= status.HTTP_400_BAD_REQUEST:
+                latencies["errors"].append(latency)
+            elif method == "POST":
+                menu_id, _, submenu_id = path.split("/")[1:4]
+                catalog.created.append(
+                    (menu_id, submenu_id, response.json()["id"]),
+                )
+
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+    return latencies
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(
+    app: FastAPI,
+    config: Config,
+    cleanup: bool = True,
+) -> dict:
+    """Seed the catalog, replay the request mix and summarize it."""
+    async with AsyncClient(
+        app=app,
+        base_url=f"http://benchmark{config.prefix}",
+    ) as client:
+        catalog = await seed(client, config)
+        hits, misses = cache_totals()
+        started = time.perf_counter()
+        latencies = await replay(client, catalog, config)
+        seconds = time.perf_counter() - started
+        hits, misses = (
+            now - before for now, before in zip(cache_totals(), (hits, misses))
+        )
+        if cleanup:
+            for menu_id in catalog.menus:
+                await client.delete(f"/{menu_id}")
+    errors = latencies.pop("errors")
+    everything = [latency for route in latencies.values() for latency in route]
+    return {
+        "commit": current_commit(),
+        "config": asdict(config),
+        "requests": len(everything),
+        "errors": len(errors),
+        "seconds": seconds,
+        "throughput": len(everything) / seconds,
+        "cache_hit_rate": hits / (hits + misses) if hits + misses else None,
+        "total": percentiles(everything),
+        "routes": {
+            route: {
+                "count": len(route_latencies),
+                **percentiles(route_latencies),
+            }
+            for route, route_latencies in sorted(latencies.items())
+        },
+    }
+
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.2f}"
+
+
+def format_report(result: dict) -> str:
+    hit_rate = result["cache_hit_rate"]
+    columns = " ".join(f"{f'p{p}, ms':>9}" for p in PERCENTILES)
+    lines = [
+        f"commit {result['commit']}: {result['requests']} requests, "
+        f"{result['errors']} errors, {result['throughput']:.1f} req/s, "
+        "cache hit rate " + ("-" if hit_rate is None else f"{hit_rate:.1%}"),
+        f"{'route':<58} {'count':>6} {columns}",
+    ]
+    rows = [("total", result["requests"], result["total"])]
+    rows += [
+        (route, stats["count"], stats)
+        for route, stats in result["routes"].items()
+    ]
+    for route, count, stats in rows:
+        cells = " ".join(
+            f"{format_ms(stats[f'p{p}']):>9}" for p in PERCENTILES
+        )
+        lines.append(f"{route:<58} {count:>6} {cells}")
+    return "\n".join(lines)
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "-"
+    return f"{(after - before) / before:+.1%}"
+
+
+def format_comparison(baseline: dict, result: dict) -> str:
+    """Show the changes of throughput and latencies against baseline."""
+    lines = [
+        f"{baseline['commit']} -> {result['commit']}: throughput "
+        f"{baseline['throughput']:.1f} -> {result['throughput']:.1f} req/s "
+        f"({change(baseline['throughput'], result['throughput'])})",
+    ]
+    routes = [("total", baseline["total"], result["total"])]
+    routes += [
+        (route, baseline["routes"][route], stats)
+        for route, stats in result["routes"].items()
+        if route in baseline["routes"]
+    ]
+    for route, before, after in routes:
+        cells = " ".join(
+            f"p{p} {change(before[f'p{p}'], after[f'p{p}']):>7}"
+            for p in PERCENTILES
+        )
+        lines.append(f"{route:<58} {cells}")
+    return "\n".join(lines)
+
+
+async def main(
+    config: Config,
+    output: str | None,
+    compare: str | None,
+) -> None:
+    await app.router.startup()
+    try:
+        result = await run(app, config)
+    finally:
+        await app.router.shutdown()
+    print(format_report(result))
+    if output:
+        with open(output, "w") as file:
+            json.dump(result, file, indent=2)
+    if compare:
+        with open(compare) as file:
+            print(format_comparison(json.load(file), result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API меню")
+    defaults = Config()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(value),
+            default=value,
+        )
+    parser.add_argument("--output", help="Сохранить результат в JSON")
+    parser.add_argument("--compare", help="Сравнить с сохранённым JSON")
+    args = vars(parser.parse_args())
+    output, compare = args.pop("output"), args.pop("compare")
+    asyncio.run(main(Config(**args), output, compare))
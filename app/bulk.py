@@ -0,0 +1,73 @@
+from email.message import Message
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError, parse_raw_as
+from pydantic.error_wrappers import ErrorWrapper
+
+from app import schemas
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+menus_import_body = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "example": [schemas.menu_import_one],
+            },
+            NDJSON_MEDIA_TYPE: {
+                "example": schemas.menu_import_ndjson,
+            },
+        },
+    },
+}
+
+
+def is_ndjson(request: Request) -> bool:
+    message = Message()
+    message["content-type"] = request.headers.get("content-type", "")
+    return message.get_content_type() == NDJSON_MEDIA_TYPE
+
+
+async def read_menus_import(request: Request) -> list[schemas.MenuImport]:
+    """Parse menus to import from a JSON array or one menu per NDJSON line.
+
+    NDJSON is parsed while it is being received. Its errors are located
+    by the line number in the file, blank lines included.
+    """
+    if not is_ndjson(request):
+        try:
+            return parse_raw_as(
+                list[schemas.MenuImport],
+                await request.body(),
+            )
+        except ValidationError as error:
+            raise RequestValidationError([ErrorWrapper(error, ("body",))])
+
+    menus = []
+    errors = []
+    buffer = b""
+    number = 0
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for number, line in enumerate(lines, start=number + 1):
+            parse_line(line, number, menus, errors)
+    parse_line(buffer, number + 1, menus, errors)
+    if errors:
+        raise RequestValidationError(errors)
+    return menus
+
+
+def parse_line(
+    line: bytes,
+    number: int,
+    menus: list[schemas.MenuImport],
+    errors: list[ErrorWrapper],
+) -> None:
+    if not line.strip():
+        return
+    try:
+        menus.append(schemas.MenuImport.parse_raw(line))
+    except ValidationError as error:
+        errors.append(ErrorWrapper(error, ("body", number)))
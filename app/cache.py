@@ -0,0 +1,616 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+from uuid import uuid4
+
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.cluster import RedisCluster
+from redis.exceptions import NoScriptError, RedisError
+
+from app.config import settings
+from app.metrics import (
+    cache_hits,
+    cache_invalidations,
+    cache_misses,
+    key_family,
+)
+
+INVALIDATE_CHANNEL = "cache:invalidate"
+INVALIDATE_WAIT = 1.0
+ETAG_HEADER = "ETag"
+
+# Keys are laid out for Redis Cluster: the keys of a menu and the versions
+# they embed share the hash tag of the menu id, the lists of all menus and
+# their versions the {menus} one, so every script and multi-key read stays
+# within one slot.
+MENUS_KEY = "{menus}"
+MENUS_VERSION = f"version:{MENUS_KEY}"
+# The tree of all menus shows every object, so every write bumps it.
+TREE_VERSION = f"version:{MENUS_KEY}:tree"
+
+# KEYS[1] is a key, which gets the current versions appended, followed by
+# the version counters. ARGV are the fields of it to read. Returns the
+# versions and the values of the fields. The versioned key keeps the hash
+# tag, hence the slot, of KEYS[1].
+READ_SCRIPT = """
+local unpack = unpack or table.unpack
+local key = KEYS[1]
+local versions = {}
+if #KEYS > 1 then
+    versions = redis.call("MGET", unpack(KEYS, 2))
+    for i = 1, #versions do
+        versions[i] = versions[i] or "0"
+    end
+    key = key .. "@" .. table.concat(versions, ".")
+end
+return {versions, redis.call("HMGET", key, unpack(ARGV))}
+"""
+
+# Deletes the lock KEYS[1] only while it holds the token ARGV[1].
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class Script:
+    """Lua script called by its SHA1.
+
+    The body is sent only when redis lacks it, e.g. after a restart, to
+    load it again. Pipelines queue EVAL of the body instead: checking the
+    scripts of a pipeline takes a round trip of its own.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(self, cache: Redis, keys: list[str], args: list):
+        try:
+            return await cache.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await cache.script_load(self.source)
+            return await cache.evalsha(self.sha, len(keys), *keys, *args)
+
+
+read_script = Script(READ_SCRIPT)
+release_script = Script(RELEASE_SCRIPT)
+
+
+async def load_scripts(cache: Redis) -> None:
+    for script in (read_script, release_script):
+        await cache.script_load(script.source)
+
+
+Build = Callable[[], Awaitable[tuple[Any, dict[str, str] | None]]]
+
+
+def prebuilt(content: Any) -> Build:
+    async def build():
+        return content, None
+
+    return build
+
+
+# Rebuilds running in this process, keyed by (key, variant).
+_flights: dict[tuple[str, str], asyncio.Future] = {}
+
+
+class LocalCache:
+    """Bounded in-process LRU in front of redis.
+
+    Holds up to maxsize keys with all of their variants, each for at most
+    ttl seconds. A maxsize of 0 disables it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._keys: OrderedDict[str, dict[str, tuple]] = OrderedDict()
+
+    def get(self, key: str, variant: str = "") -> Any | None:
+        if not self.maxsize or key not in self._keys:
+            return None
+        expires, value = self._keys[key].get(variant, (0, None))
+        if expires < time.monotonic():
+            self._keys[key].pop(variant, None)
+            return None
+        self._keys.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, variant: str = "") -> None:
+        if not self.maxsize:
+            return
+        variants = self._keys.setdefault(key, {})
+        variants[variant] = (time.monotonic() + self.ttl, value)
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+    def evict(self, *keys: str) -> None:
+        for key in keys:
+            self._keys.pop(key, None)
+
+    def clear(self) -> None:
+        self._keys.clear()
+
+
+# Bodies and headers of responses by versioned key, and the versions.
+local_cache = LocalCache(
+    maxsize=settings.CACHE_L1_SIZE,
+    ttl=settings.CACHE_L1_TTL,
+)
+local_versions = LocalCache(
+    maxsize=settings.CACHE_L1_SIZE,
+    ttl=settings.CACHE_L1_TTL,
+)
+
+# Versions of deleted objects outlive every key that may embed them.
+DELETED_VERSION_TTL = max(
+    settings.CACHE_TTL,
+    settings.CACHE_TTL_MENU,
+    settings.CACHE_TTL_SUBMENU,
+    settings.CACHE_TTL_DISH,
+)
+
+
+def menu_key(menu_id: str) -> str:
+    return f"menu:{{{menu_id}}}"
+
+
+def menu_tree_key(menu_id: str) -> str:
+    return f"{menu_key(menu_id)}:tree"
+
+
+def submenu_key(menu_id: str, submenu_id: str) -> str:
+    return f"{menu_key(menu_id)}:submenu:{submenu_id}"
+
+
+def menu_version(menu_id: str) -> str:
+    return f"version:{menu_key(menu_id)}"
+
+
+def menu_tree_version(menu_id: str) -> str:
+    # Bumped by the changes of a menu that leave menu_version as it is.
+    return f"{menu_version(menu_id)}:tree"
+
+
+def submenu_version(menu_id: str, submenu_id: str) -> str:
+    return f"version:{submenu_key(menu_id, submenu_id)}"
+
+
+def versioned_key(key: str, versions: Iterable[int]) -> str:
+    return f"{key}@{'.'.join(map(str, versions))}"
+
+
+def latest_key(key: str) -> str:
+    return f"latest:{key}"
+
+
+def jittered(ttl: int) -> int:
+    """Shorten ttl by up to CACHE_TTL_JITTER of it.
+
+    Keys written together then do not expire together.
+    """
+    return ttl - random.randint(0, int(ttl * settings.CACHE_TTL_JITTER))
+
+
+def entry_fields(variant: str = "") -> tuple[str, str]:
+    suffix = f":{variant}" if variant else ""
+    return f"body{suffix}", f"headers{suffix}"
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str | None) -> bool:
+    # If-None-Match uses the weak comparison.
+    if etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={
+            name: value
+            for name, value in headers.items()
+            if name.lower() not in ("content-length", "content-type")
+        },
+    )
+
+
+def conditional(response: Response, if_none_match: str | None) -> Response:
+    if if_none_match and etag_matches(
+        if_none_match,
+        response.headers.get(ETAG_HEADER),
+    ):
+        return not_modified(response.headers)
+    return response
+
+
+async def get_cached_response(
+    cache: Redis,
+    key: str,
+    variant: str = "",
+) -> Response | None:
+    body, headers = await cache.hmget(key, *entry_fields(variant))
+    if body is None:
+        return None
+    return make_response(body, json.loads(headers) if headers else None)
+
+
+def make_response(body: bytes, headers: dict[str, str] | None) -> Response:
+    return Response(
+        content=body,
+        media_type=JSONResponse.media_type,
+        headers=headers,
+    )
+
+
+def render_response(
+    content: Any,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    response = JSONResponse(content=jsonable_encoder(content), headers=headers)
+    response.headers[ETAG_HEADER] = make_etag(response.body)
+    return response
+
+
+async def cache_response(
+    cache: Redis,
+    key: str,
+    content: Any,
+    variant: str = "",
+    headers: dict[str, str] | None = None,
+    ttl: int = settings.CACHE_TTL,
+    latest: str | None = None,
+    lock: tuple[str, str] | None = None,
+) -> Response:
+    """Cache the rendered body of content under key.
+
+    lock, a (name, token) pair, is released in the same round trip.
+    """
+    async with cache.pipeline(transaction=False) as pipe:
+        response = queue_response(
+            pipe,
+            key,
+            content,
+            variant,
+            headers,
+            ttl,
+            latest,
+        )
+        if lock is not None:
+            pipe.eval(RELEASE_SCRIPT, 1, *lock)
+        await pipe.execute()
+    return response
+
+
+def queue_response(
+    pipe: Pipeline,
+    key: str,
+    content: Any,
+    variant: str = "",
+    headers: dict[str, str] | None = None,
+    ttl: int = settings.CACHE_TTL,
+    latest: str | None = None,
+) -> Response:
+    """Add the commands caching content under key to pipe.
+
+    Every key is a hash, so the variants of one resource (e.g. the pages
+    of a list) are stored in its fields and expire together with the key.
+    The key expires after a jittered ttl counted from its first variant.
+
+    The strong ETag of the body is stored with the headers, so conditional
+    requests are answered without reading the body.
+
+    latest, when given, is pointed at key for stale reads of the resource.
+    """
+    response = render_response(content, headers)
+    headers = {**(headers or {}), ETAG_HEADER: response.headers[ETAG_HEADER]}
+    body_field, headers_field = entry_fields(variant)
+    mapping = {body_field: response.body, headers_field: json.dumps(headers)}
+    ttl = jittered(ttl)
+    pipe.hset(key, mapping=mapping)
+    pipe.expire(key, ttl, nx=True)
+    if latest is not None:
+        pipe.set(latest, key, ex=ttl)
+    return response
+
+
+async def read_entry(
+    cache: Redis,
+    key: str,
+    versions: list[str],
+    fields: list[str],
+) -> tuple[str, list[bytes | None]]:
+    """Resolve the versioned key and read fields of it in one round trip.
+
+    Versions known locally are not read from redis again.
+    """
+    known = [local_versions.get(name) for name in versions]
+    if None not in known:
+        if versions:
+            key = versioned_key(key, known)
+        return key, await cache.hmget(key, *fields)
+    current, values = await read_script(cache, [key, *versions], fields)
+    current = [int(version) for version in current]
+    for name, version in zip(versions, current):
+        local_versions.set(name, version)
+    return versioned_key(key, current), values
+
+
+async def get_cached(
+    cache: Redis,
+    key: str,
+    versions: list[str],
+    variant: str,
+    if_none_match: str | None,
+) -> tuple[str, Response | None]:
+    """Look the response of key up in the local cache, then in redis.
+
+    Returns the versioned key and the response, a 304 when if_none_match
+    matches its ETag, or None on a miss.
+    """
+    base = key
+    known = [local_versions.get(name) for name in versions]
+    if None not in known:
+        if versions:
+            key = versioned_key(base, known)
+        if cached := local_cache.get(key, variant):
+            cache_hits.inc(key_family(base), "local")
+            return key, conditional(make_response(*cached), if_none_match)
+    body_field, headers_field = entry_fields(variant)
+    if if_none_match:
+        # Only the small headers field is read until the ETag mismatches.
+        key, (headers,) = await read_entry(
+            cache,
+            base,
+            versions,
+            [headers_field],
+        )
+        headers = json.loads(headers) if headers else None
+        if headers and etag_matches(if_none_match, headers.get(ETAG_HEADER)):
+            cache_hits.inc(key_family(base), "redis")
+            return key, not_modified(headers)
+        response = await get_cached_response(cache, key, variant)
+    else:
+        key, (body, headers) = await read_entry(
+            cache,
+            base,
+            versions,
+            [body_field, headers_field],
+        )
+        response = None
+        if body is not None:
+            headers = json.loads(headers) if headers else None
+            response = make_response(body, headers)
+    if response is None:
+        return key, None
+    cache_hits.inc(key_family(base), "redis")
+    local_cache.set(key, (response.body, dict(response.headers)), variant)
+    return key, conditional(response, if_none_match)
+
+
+async def get_or_build(
+    cache: Redis,
+    key: str,
+    build: Build,
+    versions: Iterable[str] = (),
+    variant: str | None = "",
+    ttl: int = settings.CACHE_TTL,
+    if_none_match: str | None = None,
+) -> Response:
+    """Return the cached response of key or build and cache it.
+
+    build returns the content and the extra headers of the response.
+    The current values of the version counters named in versions are
+    embedded in the cached key, so bumping any of them makes the cached
+    response unreachable.
+
+    Concurrent misses of one key in this process share a single build.
+    A 304 is returned when if_none_match matches the ETag of the response.
+    A variant of None is built on every request and never cached.
+    """
+    if variant is None:
+        cache_misses.inc(key_family(key))
+        return conditional(render_response(*await build()), if_none_match)
+    base = key
+    versions = list(versions)
+    key, response = await get_cached(
+        cache,
+        base,
+        versions,
+        variant,
+        if_none_match,
+    )
+    if response is not None:
+        return response
+    flight = (key, variant)
+    if flight in _flights:
+        cache_hits.inc(key_family(base), "flight")
+        leader = _flights[flight]
+        try:
+            body, headers = await asyncio.shield(leader)
+        except asyncio.CancelledError:
+            if not leader.cancelled():
+                raise
+            # The leading request was cancelled, e.g. on a disconnect.
+            return await get_or_build(
+                cache,
+                base,
+                build,
+                versions,
+                variant,
+                ttl,
+                if_none_match,
+            )
+        return conditional(make_response(body, headers), if_none_match)
+    future = asyncio.get_running_loop().create_future()
+    _flights[flight] = future
+    try:
+        response = await rebuild(cache, base, key, build, variant, ttl)
+    except Exception as error:
+        future.set_exception(error)
+        # Retrieve it so a miss without followers is not logged.
+        future.exception()
+        raise
+    else:
+        future.set_result((response.body, dict(response.headers)))
+    finally:
+        if not future.done():
+            future.cancel()
+        del _flights[flight]
+    return conditional(response, if_none_match)
+
+
+async def get_stale_response(
+    cache: Redis,
+    base: str,
+    key: str,
+    variant: str,
+) -> Response | None:
+    stale = await cache.get(latest_key(base))
+    if stale is None or stale.decode() == key:
+        return None
+    return await get_cached_response(cache, stale.decode(), variant)
+
+
+async def rebuild(
+    cache: Redis,
+    base: str,
+    key: str,
+    build: Build,
+    variant: str,
+    ttl: int,
+) -> Response:
+    """Build the response of key under a lock shared by all workers.
+
+    When another worker holds the lock, the latest cached version of the
+    resource is served or, when there is none, the fresh value is awaited
+    for up to CACHE_LOCK_WAIT seconds before building it anyway. The
+    latest version stays available for CACHE_STALE_TTL seconds after the
+    rebuild starts. Only fresh values reach the local cache.
+
+    build is not called when the latest version is served, so a write-
+    through skips the key the lock holder is writing after reading the
+    same versions.
+    """
+    lock = (f"lock:{key}:{variant}", uuid4().hex)
+    async with cache.pipeline(transaction=False) as pipe:
+        pipe.set(*lock, nx=True, px=int(settings.CACHE_LOCK_TIMEOUT * 1000))
+        pipe.expire(latest_key(base), settings.CACHE_STALE_TTL, lt=True)
+        acquired, _ = await pipe.execute()
+    if not acquired:
+        if response := await get_stale_response(cache, base, key, variant):
+            cache_hits.inc(key_family(base), "stale")
+            return response
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.CACHE_LOCK_WAIT
+        while loop.time() < deadline:
+            await asyncio.sleep(settings.CACHE_LOCK_POLL)
+            if response := await get_cached_response(cache, key, variant):
+                cache_hits.inc(key_family(base), "wait")
+                local_cache.set(
+                    key,
+                    (response.body, dict(response.headers)),
+                    variant,
+                )
+                return response
+        lock = None
+    cache_misses.inc(key_family(base))
+    try:
+        content, headers = await build()
+    except Exception:
+        if lock is not None:
+            await release_script(cache, [lock[0]], [lock[1]])
+        raise
+    response = await cache_response(
+        cache,
+        key,
+        content,
+        variant=variant,
+        headers=headers,
+        ttl=ttl,
+        latest=latest_key(base) if key != base else None,
+        lock=lock,
+    )
+    local_cache.set(key, (response.body, dict(response.headers)), variant)
+    return response
+
+
+async def invalidate(
+    cache: Redis,
+    *versions: str,
+    deleted: Iterable[str] = (),
+) -> None:
+    """Bump version counters in one round-trip.
+
+    Cached keys embedding the old values are never read again and age out
+    via their TTL. The counters of deleted objects expire once no cached
+    key can embed them. Other processes are notified to drop their local
+    copies of the counters.
+    """
+    deleted = list(deleted)
+    names = [*versions, *deleted]
+    async with cache.pipeline(transaction=False) as pipe:
+        for name in names:
+            pipe.incr(name)
+        for name in deleted:
+            pipe.expire(name, DELETED_VERSION_TTL)
+        # Cluster pipelines refuse PUBLISH, and without pub/sub a cluster
+        # runs no local caches to notify.
+        if not isinstance(cache, RedisCluster):
+            pipe.publish(INVALIDATE_CHANNEL, "\n".join(names))
+        await pipe.execute()
+    local_versions.evict(*names)
+    for name in names:
+        cache_invalidations.inc(key_family(name))
+
+
+async def listen_invalidations(cache: Redis) -> None:
+    """Evict versions bumped by any process from the local cache.
+
+    Messages published while disconnected are lost, so the local cache is
+    cleared whenever the subscription is (re)established.
+    """
+    while True:
+        try:
+            async with cache.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                local_versions.clear()
+                local_cache.clear()
+                while True:
+                    # Waits are bounded, as the socket timeout would drop
+                    # an idle subscription.
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=INVALIDATE_WAIT,
+                    )
+                    if message is not None:
+                        local_versions.evict(
+                            *message["data"].decode().split("\n"),
+                        )
+        except RedisError:
+            local_versions.clear()
+            local_cache.clear()
+            await asyncio.sleep(1)
@@ -26,10 +26,72 @@ class Settings:
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
         f"@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
+    ASYNC_DATABASE_URL = (
+        f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}"
+        f"@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
+    )
+
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "") == "1"
 
     REDIS_SERVER = os.getenv("REDIS_SERVER", "redis")
     REDIS_PORT = os.getenv("REDIS_PORT", 6379)
     REDIS_DB = os.getenv("REDIS_DB", 1)
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(
+        os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 2),
+    )
+    REDIS_HEALTH_CHECK_INTERVAL = int(
+        os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30),
+    )
+    # host:port of the sentinels, comma separated, to find the master of
+    # REDIS_SENTINEL_MASTER through them.
+    REDIS_SENTINELS = [
+        (host, int(port))
+        for host, port in (
+            address.strip().rsplit(":", 1)
+            for address in os.getenv("REDIS_SENTINELS", "").split(",")
+            if address.strip()
+        )
+    ]
+    REDIS_SENTINEL_MASTER = os.getenv("REDIS_SENTINEL_MASTER", "mymaster")
+    # REDIS_SERVER and REDIS_PORT then name any node of the cluster.
+    REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "") == "1"
+
+    CACHE_TTL = int(os.getenv("CACHE_TTL", 3600))
+    CACHE_TTL_MENU = int(os.getenv("CACHE_TTL_MENU", CACHE_TTL))
+    CACHE_TTL_SUBMENU = int(os.getenv("CACHE_TTL_SUBMENU", CACHE_TTL))
+    CACHE_TTL_DISH = int(os.getenv("CACHE_TTL_DISH", CACHE_TTL))
+    CACHE_TTL_JITTER = float(os.getenv("CACHE_TTL_JITTER", 0.1))
+    CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", 30))
+    CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 5))
+    CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 0.5))
+    CACHE_LOCK_POLL = float(os.getenv("CACHE_LOCK_POLL", 0.02))
+    # Invalidations reach the local cache over pub/sub, which the asyncio
+    # cluster client lacks.
+    CACHE_L1_SIZE = 0 if REDIS_CLUSTER else int(os.getenv("CACHE_L1_SIZE", 0))
+    CACHE_L1_TTL = float(os.getenv("CACHE_L1_TTL", 30))
+    CACHE_WRITE_THROUGH = os.getenv("CACHE_WRITE_THROUGH", "") == "1"
+    CACHE_WARMUP = os.getenv("CACHE_WARMUP", "") == "1"
+    CACHE_WARMUP_BATCH = int(os.getenv("CACHE_WARMUP_BATCH", 500))
+    CACHE_WARMUP_TIMEOUT = int(os.getenv("CACHE_WARMUP_TIMEOUT", 300))
+
+    DEBUG_TRACING = os.getenv("DEBUG_TRACING", "") == "1"
+    DEBUG_REQUESTS_SIZE = int(os.getenv("DEBUG_REQUESTS_SIZE", 100))
+
+    PAGE_SIZE = int(os.getenv("PAGE_SIZE", 100))
+    PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 1000))
+    PAGE_SIZES_CACHED = [
+        int(size)
+        for size in os.getenv("PAGE_SIZES_CACHED", str(PAGE_SIZE)).split(",")
+        if size.strip()
+    ]
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
 
 
 settings = Settings()
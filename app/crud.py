@@ -1,6 +1,11 @@
+from collections.abc import AsyncIterator
 from uuid import uuid4
 
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, insert, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import Select
 
 from app import models, schemas
 
@@ -11,12 +16,108 @@ DEL_SUBMENU_RESULT = {
 }
 DEL_DISH_RESULT = {"status": True, "message": "The dish has been deleted"}
 
+MENU_TREE_OPTIONS = (
+    selectinload(models.Menu.submenu).selectinload(models.SubMenu.dish),
+)
+
+
+def paginate(
+    query: Select,
+    column,
+    limit: int | None,
+    after: str | None,
+) -> Select:
+    if after is not None:
+        query = query.filter(column > after)
+    return query.order_by(column).limit(limit)
+
+
+async def change_counts(
+    db: AsyncSession,
+    model: type[models.Base],
+    object_id: str,
+    **deltas,
+) -> None:
+    """Add deltas to the counters of a row in a single UPDATE.
+
+    The new values are computed by the database, so concurrent writes
+    do not lose each other's changes.
+    """
+    await db.execute(
+        update(model)
+        .where(model.id == object_id)
+        .values(
+            {
+                getattr(model, name): getattr(model, name) + delta
+                for name, delta in deltas.items()
+            },
+        ),
+    )
+
+
+async def get_all_menu(
+    db: AsyncSession,
+    limit: int | None = None,
+    after: str | None = None,
+) -> list[models.Menu]:
+    query = paginate(select(models.Menu), models.Menu.id, limit, after)
+    return (await db.scalars(query)).all()
+
+
+async def get_all_menu_tree(db: AsyncSession) -> list[models.Menu]:
+    return (
+        await db.scalars(
+            select(models.Menu)
+            .order_by(models.Menu.id)
+            .options(*MENU_TREE_OPTIONS),
+        )
+    ).all()
+
+
+async def get_menu_tree(db: AsyncSession, menu_id: str) -> models.Menu:
+    return await db.scalar(
+        select(models.Menu)
+        .filter(models.Menu.id == menu_id)
+        .options(*MENU_TREE_OPTIONS),
+    )
 
-def get_all_menu(db: Session) -> list[models.Menu]:
-    return db.query(models.Menu).all()
 
+async def stream_catalog(
+    db: AsyncSession,
+    chunk_size: int,
+) -> AsyncIterator[Row]:
+    """Yield every dish with its submenu and menu, ordered by menu and submenu.
+
+    Menus and submenus without dishes are yielded with empty dish (and
+    submenu) columns. Rows are fetched from a server-side cursor in chunks
+    of chunk_size.
+    """
+    query = (
+        select(
+            models.Menu.id.label("menu_id"),
+            models.Menu.title.label("menu_title"),
+            models.Menu.description.label("menu_description"),
+            models.SubMenu.id.label("submenu_id"),
+            models.SubMenu.title.label("submenu_title"),
+            models.SubMenu.description.label("submenu_description"),
+            models.Dish.id.label("dish_id"),
+            models.Dish.title.label("dish_title"),
+            models.Dish.description.label("dish_description"),
+            models.Dish.price.label("dish_price"),
+        )
+        .outerjoin(models.SubMenu, models.SubMenu.menu_id == models.Menu.id)
+        .outerjoin(models.Dish, models.Dish.submenu_id == models.SubMenu.id)
+        .order_by(models.Menu.id, models.SubMenu.id, models.Dish.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for row in await db.stream(query):
+        yield row
 
-def create_menu(db: Session, menu: schemas.MenuCreate) -> models.Menu:
+
+async def create_menu(
+    db: AsyncSession,
+    menu: schemas.MenuCreate,
+) -> models.Menu:
     id_menu = str(uuid4())
     db_menu = models.Menu(
         id=id_menu,
@@ -24,164 +125,268 @@ def create_menu(db: Session, menu: schemas.MenuCreate) -> models.Menu:
         description=menu.description,
     )
     db.add(db_menu)
-    db.commit()
-    db.refresh(db_menu)
+    await db.commit()
     return db_menu
 
 
-def get_menu_by_title(db: Session, title: str) -> models.Menu:
-    return db.query(models.Menu).filter(models.Menu.title == title).first()
-
-
-def get_menu_by_id(db: Session, menu_id: str) -> models.Menu:
-    return db.get(models.Menu, menu_id)
-
-
-def patch_menu(
-    db: Session,
+async def import_menus(
+    db: AsyncSession,
+    menus: list[schemas.MenuImport],
+) -> list[models.Menu]:
+    """Insert menus with all their submenus and dishes in one transaction.
+
+    Rows of each table go in a single executemany and the counters are
+    computed up front instead of being updated per row.
+    """
+    menu_rows, submenu_rows, dish_rows = [], [], []
+    for menu in menus:
+        menu_id = str(uuid4())
+        for submenu in menu.submenus:
+            submenu_id = str(uuid4())
+            submenu_rows.append(
+                {
+                    "id": submenu_id,
+                    "menu_id": menu_id,
+                    "title": submenu.title,
+                    "description": submenu.description,
+                    "dishes_count": len(submenu.dishes),
+                },
+            )
+            dish_rows.extend(
+                {
+                    "id": str(uuid4()),
+                    "submenu_id": submenu_id,
+                    **dish.dict(),
+                }
+                for dish in submenu.dishes
+            )
+        menu_rows.append(
+            {
+                "id": menu_id,
+                "title": menu.title,
+                "description": menu.description,
+                "submenus_count": len(menu.submenus),
+                "dishes_count": sum(
+                    len(submenu.dishes) for submenu in menu.submenus
+                ),
+            },
+        )
+    for model, rows in (
+        (models.Menu, menu_rows),
+        (models.SubMenu, submenu_rows),
+        (models.Dish, dish_rows),
+    ):
+        if rows:
+            await db.execute(insert(model), rows)
+    await db.commit()
+    return [models.Menu(**row) for row in menu_rows]
+
+
+async def get_menu_by_id(db: AsyncSession, menu_id: str) -> models.Menu:
+    return await db.get(models.Menu, menu_id)
+
+
+async def get_path(
+    db: AsyncSession,
+    menu_id: str,
+    submenu_id: str | None = None,
+    dish_id: str | None = None,
+) -> tuple[models.Menu | None, models.SubMenu | None, models.Dish | None]:
+    query = select(models.Menu).filter(models.Menu.id == menu_id)
+    if submenu_id is not None:
+        query = query.add_columns(models.SubMenu).outerjoin(
+            models.SubMenu,
+            and_(
+                models.SubMenu.menu_id == models.Menu.id,
+                models.SubMenu.id == submenu_id,
+            ),
+        )
+    if dish_id is not None:
+        query = query.add_columns(models.Dish).outerjoin(
+            models.Dish,
+            and_(
+                models.Dish.submenu_id == models.SubMenu.id,
+                models.Dish.id == dish_id,
+            ),
+        )
+    row = (await db.execute(query)).first() or ()
+    return (*row, *[None] * (3 - len(row)))
+
+
+async def patch_menu(
+    db: AsyncSession,
     db_menu: models.Menu,
     menu: schemas.MenuBase,
 ) -> models.Menu:
     update_data = menu.dict(exclude_unset=True)
-    update_object(data=update_data, obj=db_menu, db=db)
+    await update_object(data=update_data, obj=db_menu, db=db)
     return db_menu
 
 
-def delete_menu(db: Session, db_menu: models.Menu) -> dict[str, object]:
-    db.delete(db_menu)
-    db.commit()
+async def delete_menu(
+    db: AsyncSession,
+    db_menu: models.Menu,
+) -> dict[str, object]:
+    # Bulk deletes instead of the ORM cascade, which loads the dishes of
+    # every submenu in a query of its own.
+    submenu_ids = select(models.SubMenu.id).filter(
+        models.SubMenu.menu_id == db_menu.id,
+    )
+    await db.execute(
+        delete(models.Dish)
+        .where(models.Dish.submenu_id.in_(submenu_ids))
+        .execution_options(synchronize_session=False),
+    )
+    await db.execute(
+        delete(models.SubMenu).where(models.SubMenu.menu_id == db_menu.id),
+    )
+    await db.execute(delete(models.Menu).where(models.Menu.id == db_menu.id))
+    await db.commit()
     return DEL_MENU_RESULT
 
 
-def get_submenu_by_title(db: Session, title: str) -> models.SubMenu:
+async def get_submenu_ids(
+    db: AsyncSession,
+    db_menu: models.Menu,
+) -> list[str]:
     return (
-        db.query(models.SubMenu).filter(models.SubMenu.title == title).first()
-    )
-
-
-def get_submenu_by_id(
-    db: Session,
-    menu: models.Menu,
-    submenu_id: str,
-) -> models.SubMenu | None:
-    db_submenu = db.get(models.SubMenu, submenu_id)
-    if db_submenu and db_submenu.menu_id == menu.id:
-        return db_submenu
-    return None
+        await db.scalars(
+            select(models.SubMenu.id).filter(
+                models.SubMenu.menu_id == db_menu.id,
+            ),
+        )
+    ).all()
 
 
-def get_all_submenu(db_menu: models.Menu) -> list[models.SubMenu]:
-    return db_menu.submenu
+async def get_all_submenu(
+    db: AsyncSession,
+    db_menu: models.Menu,
+    limit: int | None = None,
+    after: str | None = None,
+) -> list[models.SubMenu]:
+    query = paginate(
+        select(models.SubMenu).filter(models.SubMenu.menu_id == db_menu.id),
+        models.SubMenu.id,
+        limit,
+        after,
+    )
+    return (await db.scalars(query)).all()
 
 
-def create_submenu(
-    db: Session,
+async def create_submenu(
+    db: AsyncSession,
     db_menu: models.Menu,
     submenu: schemas.SubMenuCreate,
 ) -> models.SubMenu:
     id_submenu = str(uuid4())
     db_submenu = models.SubMenu(
         id=id_submenu,
-        menu=db_menu,
+        menu_id=db_menu.id,
         title=submenu.title,
         description=submenu.description,
     )
-    db_menu.submenus_count += 1
     db.add(db_submenu)
-    db.commit()
-    db.refresh(db_submenu)
+    await change_counts(db, models.Menu, db_menu.id, submenus_count=1)
+    await db.commit()
     return db_submenu
 
 
-def patch_submenu(
-    db: Session,
+async def patch_submenu(
+    db: AsyncSession,
     db_submenu: models.SubMenu,
     submenu: schemas.MenuBase,
 ) -> models.SubMenu:
     update_data = submenu.dict(exclude_unset=True)
-    update_object(data=update_data, obj=db_submenu, db=db)
+    await update_object(data=update_data, obj=db_submenu, db=db)
     return db_submenu
 
 
-def delete_submenu(
-    db: Session,
+async def delete_submenu(
+    db: AsyncSession,
+    db_menu: models.Menu,
     db_submenu: models.SubMenu,
 ) -> dict[str, object]:
-    db_submenu.menu.dishes_count -= db_submenu.dishes_count
-    db_submenu.menu.submenus_count -= 1
-    db.delete(db_submenu)
-    db.commit()
+    deleted_dishes = await db.execute(
+        delete(models.Dish).where(models.Dish.submenu_id == db_submenu.id),
+    )
+    await db.execute(
+        delete(models.SubMenu).where(models.SubMenu.id == db_submenu.id),
+    )
+    await change_counts(
+        db,
+        models.Menu,
+        db_menu.id,
+        submenus_count=-1,
+        dishes_count=-deleted_dishes.rowcount,
+    )
+    await db.commit()
     return DEL_SUBMENU_RESULT
 
 
-def update_object(data: dict[str, str], obj: object, db: Session) -> None:
+async def update_object(
+    data: dict[str, str],
+    obj: object,
+    db: AsyncSession,
+) -> None:
     for key, value in data.items():
         setattr(obj, key, value)
-    db.commit()
-    db.refresh(obj)
-
+    await db.commit()
 
-def get_all_dish(db_submenu: models.SubMenu) -> list[models.Dish]:
-    return db_submenu.dish
 
-
-def get_dish_by_title(
-    db: Session,
+async def get_all_dish(
+    db: AsyncSession,
     db_submenu: models.SubMenu,
-    title: str,
-) -> models.Dish:
-    return (
-        db.query(models.Dish)
-        .filter(models.Dish.title == title, models.Dish.submenu == db_submenu)
-        .first()
+    limit: int | None = None,
+    after: str | None = None,
+) -> list[models.Dish]:
+    query = paginate(
+        select(models.Dish).filter(models.Dish.submenu_id == db_submenu.id),
+        models.Dish.id,
+        limit,
+        after,
     )
+    return (await db.scalars(query)).all()
 
 
-def create_dish(
-    db: Session,
+async def create_dish(
+    db: AsyncSession,
+    db_menu: models.Menu,
     db_submenu: models.SubMenu,
     dish: schemas.DishCreate,
 ) -> models.Dish:
     id_dish = str(uuid4())
     db_dish = models.Dish(
         id=id_dish,
-        submenu=db_submenu,
+        submenu_id=db_submenu.id,
         title=dish.title,
         description=dish.description,
         price=dish.price,
     )
-    db_submenu.dishes_count += 1
-    db_submenu.menu.dishes_count += 1
     db.add(db_dish)
-    db.commit()
-    db.refresh(db_dish)
+    await change_counts(db, models.SubMenu, db_submenu.id, dishes_count=1)
+    await change_counts(db, models.Menu, db_menu.id, dishes_count=1)
+    await db.commit()
     return db_dish
 
 
-def get_dish_by_id(
-    db: Session,
-    submenu: models.SubMenu,
-    dish_id: str,
-) -> models.Dish | None:
-    db_dish = db.get(models.Dish, dish_id)
-    if db_dish and db_dish.submenu_id == submenu.id:
-        return db_dish
-    return None
-
-
-def patch_dish(
-    db: Session,
+async def patch_dish(
+    db: AsyncSession,
     db_dish: models.Dish,
     dish: schemas.DishBase,
 ) -> models.Dish:
     update_data = dish.dict(exclude_unset=True)
-    update_object(data=update_data, obj=db_dish, db=db)
+    await update_object(data=update_data, obj=db_dish, db=db)
     return db_dish
 
 
-def delete_dish(db: Session, db_dish: models.Dish) -> dict[str, object]:
-    db_dish.submenu.dishes_count -= 1
-    db_dish.submenu.menu.dishes_count -= 1
-    db.delete(db_dish)
-    db.commit()
+async def delete_dish(
+    db: AsyncSession,
+    db_menu: models.Menu,
+    db_submenu: models.SubMenu,
+    db_dish: models.Dish,
+) -> dict[str, object]:
+    await change_counts(db, models.SubMenu, db_submenu.id, dishes_count=-1)
+    await change_counts(db, models.Menu, db_menu.id, dishes_count=-1)
+    await db.delete(db_dish)
+    await db.commit()
     return DEL_DISH_RESULT
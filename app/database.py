@@ -1,20 +1,62 @@
-from sqlalchemy import create_engine
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 from app.config import settings
+from app.metrics import instrument_engine
+from app.tracing import trace_engine
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL
+
+T = TypeVar("T")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    # A session checks a connection out on its first query only, so
+    # responses served from the cache never take one from the pool.
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def released(
+    db: AsyncSession,
+    build: Callable[[], Awaitable[T]],
+) -> Callable[[], Awaitable[T]]:
+    """Return the connection of db to the pool as soon as build is done.
+
+    Otherwise it is held while the response is cached and sent, until
+    get_db exits after the background tasks.
+    """
+
+    async def build_and_release() -> T:
+        try:
+            return await build()
+        finally:
+            await db.close()
+
+    return build_and_release
+
+
+engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+instrument_engine(engine.sync_engine)
+if settings.DEBUG_TRACING:
+    trace_engine(engine.sync_engine)
+SessionLocal = sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 Base = declarative_base()
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from enum import Enum
+
+from sqlalchemy.engine import Row
+
+CSV_COLUMNS = (
+    "menu_id",
+    "menu_title",
+    "menu_description",
+    "submenu_id",
+    "submenu_title",
+    "submenu_description",
+    "dish_id",
+    "dish_title",
+    "dish_description",
+    "dish_price",
+)
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+async def ndjson_lines(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    """Render rows ordered by menu and submenu as one menu per line.
+
+    Only the current menu is kept in memory. Lines are accepted by the
+    bulk import.
+    """
+    menu = None
+    async for row in rows:
+        if menu is None or menu["id"] != row.menu_id:
+            if menu is not None:
+                yield json.dumps(menu, ensure_ascii=False) + "\n"
+            menu = {
+                "id": row.menu_id,
+                "title": row.menu_title,
+                "description": row.menu_description,
+                "submenus": [],
+            }
+        if row.submenu_id is None:
+            continue
+        submenus = menu["submenus"]
+        if not submenus or submenus[-1]["id"] != row.submenu_id:
+            submenus.append(
+                {
+                    "id": row.submenu_id,
+                    "title": row.submenu_title,
+                    "description": row.submenu_description,
+                    "dishes": [],
+                },
+            )
+        if row.dish_id is not None:
+            submenus[-1]["dishes"].append(
+                {
+                    "id": row.dish_id,
+                    "title": row.dish_title,
+                    "description": row.dish_description,
+                    "price": row.dish_price,
+                },
+            )
+    if menu is not None:
+        yield json.dumps(menu, ensure_ascii=False) + "\n"
+
+
+async def csv_lines(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    """Render rows as CSV, one line per dish.
+
+    Menus and submenus without dishes get a line with empty dish fields.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+    async for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+RENDERERS = {
+    ExportFormat.ndjson: ndjson_lines,
+    ExportFormat.csv: csv_lines,
+}
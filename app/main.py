@@ -1,7 +1,20 @@
+import asyncio
+import logging
+
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
+from redis.exceptions import RedisError
+from sqlalchemy.exc import SQLAlchemyError
 
+from app import metrics, tracing
 from app.api.api_v1 import menu
+from app.cache import listen_invalidations, load_scripts
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.redis import close_redis, get_redis
+from app.warmup import warm_up_once
+
+logger = logging.getLogger(__name__)
 
 
 def custom_openapi():
@@ -23,4 +36,39 @@ def custom_openapi():
 app = FastAPI()
 app.openapi = custom_openapi
 
+app.add_middleware(metrics.MetricsMiddleware)
+if settings.DEBUG_TRACING:
+    app.add_middleware(tracing.TracingMiddleware)
+    app.include_router(tracing.router)
+
 app.include_router(menu.router, prefix="/api/v1/menus")
+app.include_router(metrics.router)
+
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await load_scripts(get_redis())
+    except RedisError:
+        # Scripts are loaded again on their first call.
+        logger.exception("Loading the redis scripts failed")
+    if settings.CACHE_L1_SIZE:
+        app.state.invalidations = asyncio.create_task(
+            listen_invalidations(get_redis()),
+        )
+    if settings.CACHE_WARMUP:
+        # Serving starts once the cache is warm; a failed warm-up only
+        # leaves it cold.
+        try:
+            async with SessionLocal() as db:
+                app.state.warm_up = await warm_up_once(db, get_redis())
+        except (RedisError, SQLAlchemyError):
+            logger.exception("Cache warm-up failed")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if settings.CACHE_L1_SIZE:
+        app.state.invalidations.cancel()
+    await engine.dispose()
+    await close_redis()
@@ -0,0 +1,253 @@
+import time
+from bisect import bisect_left
+from collections.abc import Iterable
+from typing import Any
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry: list["Metric"] = []
+
+
+class Metric:
+    """Metric of the Prometheus text format with values per label values.
+
+    Values are kept per process, like prometheus_client does without its
+    multiprocess mode.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: dict[tuple, Any] = {}
+        registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels) -> None:
+        if labels not in self.values:
+            # Count per bucket, then the sum and the count of observations.
+            self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts = self.values[labels]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            counts[index] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        names = (*self.labels, "le")
+        for labels, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket"
+                    f"{format_labels(names, (*labels, bound))} {cumulative}"
+                )
+            yield (
+                f"{self.name}_bucket"
+                f"{format_labels(names, (*labels, '+Inf'))} {counts[-1]}"
+            )
+            label_text = format_labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {counts[-2]}"
+            yield f"{self.name}_count{label_text} {counts[-1]}"
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки запроса",
+    ("method", "route", "status"),
+)
+cache_hits = Counter(
+    "cache_hits_total",
+    "Ответы из кеша: local, redis, flight (общая сборка в процессе), "
+    "stale (устаревшая версия на время сборки), wait (сборка другим "
+    "воркером)",
+    ("family", "source"),
+)
+cache_misses = Counter(
+    "cache_misses_total",
+    "Ответы, собранные из базы",
+    ("family",),
+)
+cache_invalidations = Counter(
+    "cache_invalidations_total",
+    "Увеличенные счётчики версий",
+    ("family",),
+)
+cache_warmup_entries = Counter(
+    "cache_warmup_entries_total",
+    "Ключи, записанные прогревом кеша",
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Время запросов к базе",
+    ("statement",),
+)
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds",
+    "Время обращений к redis; pipeline считается одним обращением",
+    ("command",),
+)
+
+
+# Key segments naming a resource or a list of them, by family.
+FAMILIES = {
+    "menus": "menus",
+    "menu": "menu",
+    "submenus": "submenu",
+    "submenu": "submenu",
+    "dishes": "dish",
+    "dish": "dish",
+}
+
+
+def key_family(key: str) -> str:
+    """Name the resource a cache key or version counter belongs to.
+
+    {menus}:tree is a menus key, menu:{id}:tree a menu key and list keys
+    belong to the family of their items: menus, menu, submenu or dish.
+    Hash tags are not part of the names.
+    """
+    segments = key.removeprefix("version:").split("@")[0].split(":")
+    names = [segment.strip("{}") for segment in segments][::2]
+    if len(names) > 1 and names[-1] == "tree":
+        names.pop()
+    return FAMILIES.get(names[-1], names[-1])
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def statement_type(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].lower() if statement else ""
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time the queries of engine, the sync_engine of an async one."""
+    if event.contains(engine, "before_cursor_execute", before_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_execute)
+    event.listen(engine, "after_cursor_execute", after_execute)
+
+
+def before_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, many):
+    started = conn.info["query_started"].pop()
+    db_query_duration.observe(
+        time.perf_counter() - started,
+        statement_type(statement),
+    )
+
+
+class MetricsMiddleware:
+    """Observe the duration of every request by its route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                route.path if route is not None else "",
+                status_code,
+            )
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
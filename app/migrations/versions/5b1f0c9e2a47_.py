@@ -0,0 +1,40 @@
+"""unique titles within parent
+
+Revision ID: 5b1f0c9e2a47
+Revises: ce97522d6235
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from alembic import op
+
+revision = "5b1f0c9e2a47"
+down_revision = "ce97522d6235"
+branch_labels = None
+depends_on = None
+
+
+# The foreign key columns lead the composite indexes, so the same indexes
+# serve lookups of the children of a parent and its cascade deletes.
+def upgrade() -> None:
+    op.drop_index(op.f("ix_menus_title"), table_name="menus")
+    op.create_index(op.f("ix_menus_title"), "menus", ["title"], unique=True)
+    op.create_index(
+        "ix_submenus_menu_id_title",
+        "submenus",
+        ["menu_id", "title"],
+        unique=True,
+    )
+    op.create_index(
+        "ix_dishes_submenu_id_title",
+        "dishes",
+        ["submenu_id", "title"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_dishes_submenu_id_title", table_name="dishes")
+    op.drop_index("ix_submenus_menu_id_title", table_name="submenus")
+    op.drop_index(op.f("ix_menus_title"), table_name="menus")
+    op.create_index(op.f("ix_menus_title"), "menus", ["title"], unique=False)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import relationship, synonym
 
 from app.database import Base
 
@@ -7,20 +7,26 @@ from app.database import Base
 class Menu(Base):
     __tablename__ = "menus"
     id = Column(String, primary_key=True, unique=True)
-    title = Column(String, index=True, nullable=False)
+    title = Column(String, index=True, unique=True, nullable=False)
     description = Column(String)
     submenus_count = Column(Integer, default=0)
     dishes_count = Column(Integer, default=0)
 
+    # Ordered like the lists, so the tree and its ETag are stable.
     submenu = relationship(
         "SubMenu",
         cascade="all, delete",
         back_populates="menu",
+        order_by="SubMenu.id",
     )
+    submenus = synonym("submenu")
 
 
 class SubMenu(Base):
     __tablename__ = "submenus"
+    __table_args__ = (
+        Index("ix_submenus_menu_id_title", "menu_id", "title", unique=True),
+    )
     id = Column(String, primary_key=True, unique=True)
     title = Column(String, index=True, nullable=False)
     description = Column(String)
@@ -32,11 +38,21 @@ class SubMenu(Base):
         "Dish",
         cascade="all, delete",
         back_populates="submenu",
+        order_by="Dish.id",
     )
+    dishes = synonym("dish")
 
 
 class Dish(Base):
     __tablename__ = "dishes"
+    __table_args__ = (
+        Index(
+            "ix_dishes_submenu_id_title",
+            "submenu_id",
+            "title",
+            unique=True,
+        ),
+    )
     id = Column(String, primary_key=True, unique=True)
     title = Column(String, index=True, nullable=False)
     description = Column(String)
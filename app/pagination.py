@@ -0,0 +1,75 @@
+import binascii
+from base64 import b64decode, urlsafe_b64encode
+from collections.abc import Sequence
+
+from fastapi import HTTPException, Query, status
+
+from app.config import settings
+
+INVALID_CURSOR = "invalid cursor"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: str) -> str:
+    return urlsafe_b64encode(last_id.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return b64decode(cursor, altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=INVALID_CURSOR,
+        )
+
+
+class Page:
+    """Keyset pagination parameters of a list route.
+
+    Without limit and cursor the whole list is returned as before.
+    """
+
+    def __init__(
+        self,
+        limit: int | None = Query(
+            default=None,
+            ge=1,
+            le=settings.PAGE_SIZE_MAX,
+            title="Количество записей на странице",
+        ),
+        cursor: str | None = Query(
+            default=None,
+            title="Курсор следующей страницы из заголовка X-Next-Cursor",
+        ),
+    ):
+        self.cursor = cursor
+        self.after = decode_cursor(cursor) if cursor else None
+        self.limit = limit
+        if self.limit is None and cursor is not None:
+            self.limit = settings.PAGE_SIZE
+
+    @property
+    def variant(self) -> str | None:
+        """Cache variant of the page, None when it is not cached.
+
+        Only the whole list and the first pages of the PAGE_SIZES_CACHED
+        sizes are cached, so arbitrary cursors and limits cannot grow the
+        cached entry of a list.
+        """
+        if self.limit is None:
+            return ""
+        if self.cursor or self.limit not in settings.PAGE_SIZES_CACHED:
+            return None
+        return str(self.limit)
+
+    @property
+    def fetch_limit(self) -> int | None:
+        # One extra row tells whether there is a next page.
+        return None if self.limit is None else self.limit + 1
+
+    def paginate(self, rows: Sequence) -> tuple[Sequence, dict[str, str]]:
+        if self.limit is None or len(rows) <= self.limit:
+            return rows, {}
+        rows = rows[: self.limit]
+        return rows, {NEXT_CURSOR_HEADER: encode_cursor(rows[-1].id)}
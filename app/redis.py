@@ -1,13 +1,160 @@
-import redis
+import time
+from collections.abc import Iterable
+
+from redis import asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.cluster import ClusterPipeline, RedisCluster
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
 
 from app.config import settings
+from app.metrics import redis_command_duration
+from app.tracing import current_trace, trace_redis
+
+CONNECTION_OPTIONS = {
+    "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+    "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+}
+
+
+def observe_pipeline(commands: Iterable[str], seconds: float) -> None:
+    redis_command_duration.observe(seconds, "PIPELINE")
+    if current_trace.get() is not None:
+        trace_redis(f"PIPELINE {' '.join(map(str, commands))}", seconds)
+
+
+def observe_command(command: str, seconds: float) -> None:
+    redis_command_duration.observe(seconds, command)
+    trace_redis(command, seconds)
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        # Executing replaces the stack, so this one keeps the commands.
+        stack = self.command_stack
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            observe_pipeline(
+                (args[0] for args, _ in stack),
+                time.perf_counter() - started,
+            )
+
+
+class TimedRedis(redis.Redis):
+    """Client timing every round trip to redis for the metrics and the
+    trace of the current request."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_command(args[0], time.perf_counter() - started)
+
+    def pipeline(
+        self,
+        transaction: bool = True,
+        shard_hint: str | None = None,
+    ) -> TimedPipeline:
+        return TimedPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
 
-pool = redis.ConnectionPool(
-    host=settings.REDIS_SERVER,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-)
+
+class TimedClusterPipeline(ClusterPipeline):
+    async def execute(
+        self,
+        raise_on_error: bool = True,
+        allow_redirections: bool = True,
+    ):
+        stack = self._command_stack
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error, allow_redirections)
+        finally:
+            observe_pipeline(
+                (command.args[0] for command in stack),
+                time.perf_counter() - started,
+            )
+
+
+class TimedRedisCluster(RedisCluster):
+    """TimedRedis for Redis Cluster.
+
+    A pipeline sends the commands to the nodes of their keys, one round
+    trip per node, and is counted as one call.
+    """
+
+    async def execute_command(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **kwargs)
+        finally:
+            observe_command(args[0], time.perf_counter() - started)
+
+    def pipeline(
+        self,
+        transaction: bool | None = None,
+        shard_hint: str | None = None,
+    ) -> TimedClusterPipeline:
+        # Raises on transactions, which the cluster does not support.
+        super().pipeline(transaction, shard_hint)
+        return TimedClusterPipeline(self)
+
+
+def create_pool() -> redis.ConnectionPool:
+    if settings.REDIS_SENTINELS:
+        sentinel = Sentinel(
+            settings.REDIS_SENTINELS,
+            sentinel_kwargs=CONNECTION_OPTIONS,
+        )
+        # Connections follow the master through failovers.
+        return SentinelConnectionPool(
+            settings.REDIS_SENTINEL_MASTER,
+            sentinel,
+            db=settings.REDIS_DB,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            **CONNECTION_OPTIONS,
+        )
+    # Requests wait for a free connection instead of failing at the limit.
+    return redis.BlockingConnectionPool(
+        host=settings.REDIS_SERVER,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        **CONNECTION_OPTIONS,
+    )
+
+
+if settings.REDIS_CLUSTER:
+    # The cluster client keeps a pool per node and discovers the nodes
+    # from the given one.
+    pool = None
+    cluster = TimedRedisCluster(
+        host=settings.REDIS_SERVER,
+        port=settings.REDIS_PORT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        **CONNECTION_OPTIONS,
+    )
+else:
+    pool = create_pool()
+    cluster = None
 
 
 def get_redis():
-    return redis.Redis(connection_pool=pool)
+    if cluster is not None:
+        return cluster
+    return TimedRedis(connection_pool=pool)
+
+
+async def close_redis() -> None:
+    if cluster is not None:
+        await cluster.close()
+    else:
+        await pool.disconnect()
@@ -1,3 +1,5 @@
+import json
+
 from fastapi import status
 from pydantic import BaseModel, Field
 
@@ -88,6 +90,22 @@ class Dish(DishBase):
         orm_mode = True
 
 
+class SubMenuTree(SubMenu):
+    dishes: list[Dish] = Field(title="Блюда подменю")
+
+
+class MenuTree(Menu):
+    submenus: list[SubMenuTree] = Field(title="Подменю меню")
+
+
+class SubMenuImport(SubMenuCreate):
+    dishes: list[DishCreate] = Field(default=[], title="Блюда подменю")
+
+
+class MenuImport(MenuCreate):
+    submenus: list[SubMenuImport] = Field(default=[], title="Подменю меню")
+
+
 response_400 = {
     "description": "Наименование уже существуют",
     "content": {
@@ -302,3 +320,70 @@ dish_delete_response_example = {
     status.HTTP_400_BAD_REQUEST: response_400,
     status.HTTP_404_NOT_FOUND: response_dish_404,
 }
+
+menu_tree_one = {
+    **menu_one,
+    "submenus": [{**submenu_one, "dishes": [dish_one, dish_two]}],
+}
+
+menus_tree_response_example = {
+    status.HTTP_200_OK: {
+        "description": "Список меню со всеми подменю и блюдами",
+        "content": {"application/json": {"example": [menu_tree_one]}},
+    },
+}
+
+menu_tree_response_example = {
+    status.HTTP_200_OK: {
+        "description": "Конкретное меню со всеми подменю и блюдами",
+        "content": {"application/json": {"example": menu_tree_one}},
+    },
+    status.HTTP_404_NOT_FOUND: response_menu_404,
+}
+
+menu_import_one = {
+    "title": menu_one["title"],
+    "description": menu_one["description"],
+    "submenus": [
+        {
+            "title": submenu_one["title"],
+            "description": submenu_one["description"],
+            "dishes": [
+                {
+                    "title": dish["title"],
+                    "description": dish["description"],
+                    "price": dish["price"],
+                }
+                for dish in (dish_one, dish_two)
+            ],
+        },
+    ],
+}
+
+menu_import_ndjson = json.dumps(menu_import_one, ensure_ascii=False)
+
+menus_import_response_example = {
+    status.HTTP_201_CREATED: {
+        "description": "Меню со всеми подменю и блюдами загружены",
+        "content": {"application/json": {"example": [menu_one]}},
+    },
+    status.HTTP_400_BAD_REQUEST: response_400,
+}
+
+menus_export_response_example = {
+    status.HTTP_200_OK: {
+        "description": "Все меню со всеми подменю и блюдами",
+        "content": {
+            "application/x-ndjson": {
+                "example": json.dumps(menu_tree_one, ensure_ascii=False),
+            },
+            "text/csv": {
+                "example": (
+                    "menu_id,menu_title,menu_description,submenu_id,"
+                    "submenu_title,submenu_description,dish_id,dish_title,"
+                    "dish_description,dish_price\n"
+                ),
+            },
+        },
+    },
+}
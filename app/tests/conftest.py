@@ -1,20 +1,36 @@
-from collections.abc import Generator
+from collections.abc import Callable, Generator, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import replace
 from typing import Any
 
 import pytest
 from alembic import command
 from alembic.config import Config
+from anyio.abc import BlockingPortal
+from anyio.from_thread import start_blocking_portal
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from redis import Redis
-from sqlalchemy import create_engine
+from redis import ConnectionPool, Redis
+from redis import asyncio as aioredis
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy_utils import create_database, database_exists
 
 from app.api.api_v1 import menu
+from app.cache import load_scripts
 from app.config import settings
 from app.database import get_db
-from app.redis import get_redis
+from app.metrics import instrument_engine
+from app.redis import TimedRedis, get_redis
+from app.tracing import Trace, TracingMiddleware, capture, trace_engine
+
+SAVEPOINT_STATEMENTS = (
+    "SAVEPOINT",
+    "RELEASE SAVEPOINT",
+    "ROLLBACK TO SAVEPOINT",
+)
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
@@ -22,7 +38,18 @@ if not database_exists(engine.url):
     create_database(engine.url)
     alembic_config = Config("alembic.ini")
     command.upgrade(alembic_config, "head")
-SessionTesting = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    poolclass=NullPool,
+)
+instrument_engine(async_engine.sync_engine)
+trace_engine(async_engine.sync_engine)
+SessionTesting = sessionmaker(
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 
 @pytest.fixture(scope="function")
@@ -33,28 +60,74 @@ def app() -> Generator[FastAPI, Any, None]:
 
 
 @pytest.fixture(scope="function")
-def db_session(app: FastAPI) -> Generator[SessionTesting, Any, None]:
-    connection = engine.connect()
-    transaction = connection.begin()
+def portal() -> Generator[BlockingPortal, Any, None]:
+    with start_blocking_portal() as portal:
+        yield portal
+
+
+@pytest.fixture(scope="function")
+def db_session(
+    app: FastAPI,
+    portal: BlockingPortal,
+) -> Generator[AsyncSession, Any, None]:
+    async def _connect():
+        return await async_engine.connect()
+
+    connection = portal.call(_connect)
+    transaction = portal.call(connection.begin)
+    portal.call(connection.begin_nested)
     session = SessionTesting(bind=connection)
+
+    # A failed write rolls back to the savepoint only, keeping the data
+    # of the test for its next requests.
+    @event.listens_for(session.sync_session, "after_transaction_end")
+    def restart_savepoint(*args):
+        if not connection.sync_connection.in_nested_transaction():
+            connection.sync_connection.begin_nested()
+
     yield session
-    session.close()
-    transaction.rollback()
-    connection.close()
+    portal.call(session.close)
+    portal.call(transaction.rollback)
+    portal.call(connection.close)
+
+
+@pytest.fixture(scope="function")
+def cache_pool(
+    app: FastAPI,
+    portal: BlockingPortal,
+) -> Generator[aioredis.Redis, Any, None]:
+    cache = TimedRedis(
+        connection_pool=aioredis.ConnectionPool(
+            host=settings.REDIS_SERVER,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+        ),
+    )
+    # As at startup, so the first read is not a NOSCRIPT miss.
+    portal.call(load_scripts, cache)
+    yield cache
+    portal.call(cache.flushdb)
+    portal.call(cache.connection_pool.disconnect)
 
 
 @pytest.fixture(scope="function")
-def cache_pool(app: FastAPI) -> Generator[Redis, Any, None]:
-    cache = get_redis()
+def cache() -> Generator[Redis, Any, None]:
+    pool = ConnectionPool(
+        host=settings.REDIS_SERVER,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+    )
+    cache = Redis(connection_pool=pool)
     yield cache
-    cache.flushdb()
+    pool.disconnect()
 
 
 @pytest.fixture(scope="function")
 def client(
     app: FastAPI,
-    db_session: SessionTesting,
-    cache_pool: Redis,
+    portal: BlockingPortal,
+    db_session: AsyncSession,
+    cache_pool: aioredis.Redis,
 ) -> Generator[TestClient, Any, None]:
     def _get_test_db():
         return db_session
@@ -64,5 +137,38 @@ def client(
 
     app.dependency_overrides[get_db] = _get_test_db
     app.dependency_overrides[get_redis] = _get_redis
-    with TestClient(app) as client:
-        yield client
+    client = TestClient(app)
+    client.portal = portal
+    yield client
+
+
+@pytest.fixture(scope="function")
+def assert_max_queries(
+    app: FastAPI,
+) -> Callable[[int], AbstractContextManager[list[Trace]]]:
+    app.add_middleware(TracingMiddleware)
+
+    @contextmanager
+    def assert_max_queries(limit: int) -> Iterator[list[Trace]]:
+        """Fail when a request made inside runs over limit SQL statements.
+
+        Yields the traces of the requests once the block exits, without
+        the savepoints the db_session fixture commits to.
+        """
+        result = []
+        with capture() as traces:
+            yield result
+        for trace in traces:
+            result.append(
+                replace(
+                    trace,
+                    queries=[
+                        query
+                        for query in trace.queries
+                        if not query.name.startswith(SAVEPOINT_STATEMENTS)
+                    ],
+                ),
+            )
+            assert len(result[-1].queries) <= limit, result[-1].describe()
+
+    return assert_max_queries
@@ -0,0 +1,42 @@
+from anyio.abc import BlockingPortal
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.benchmark import Config, format_comparison, format_report, run
+
+
+class TestBenchmark:
+    def test_run(
+        self,
+        app: FastAPI,
+        client: TestClient,
+        portal: BlockingPortal,
+    ):
+        # One worker: the tests share a single database session.
+        config = Config(
+            menus=2,
+            submenus=2,
+            dishes=3,
+            requests=200,
+            concurrency=1,
+            write_ratio=0.2,
+            prefix="",
+        )
+        result = portal.call(run, app, config)
+        assert result["requests"] == 200
+        assert result["errors"] == 0
+        assert 0 < result["cache_hit_rate"] < 1
+        routes = result["routes"]
+        assert sum(stats["count"] for stats in routes.values()) == 200
+        assert "GET /{menu_id}/submenus/{submenu_id}/dishes" in routes
+        total = result["total"]
+        assert 0 < total["p50"] <= total["p95"] <= total["p99"]
+        assert client.get("").json() == []
+
+        report = format_report(result)
+        assert "GET /{menu_id}" in report
+        comparison = format_comparison(
+            {**result, "throughput": result["throughput"] / 2},
+            result,
+        )
+        assert "+100.0%" in comparison
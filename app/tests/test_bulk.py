@@ -0,0 +1,106 @@
+import json
+
+from fastapi import status
+from fastapi.testclient import TestClient
+from redis import Redis
+
+from app.api.api_v1.menu import TITLE_REGISTERED
+from app.bulk import NDJSON_MEDIA_TYPE
+from app.cache import MENUS_KEY, MENUS_VERSION, versioned_key
+from app.tests.data import data_dish, data_menu, data_submenu, data_up_menu
+
+
+def menu_import(menu: dict, submenus_count: int, dishes_count: int) -> dict:
+    return {
+        **menu,
+        "submenus": [
+            {
+                **data_submenu,
+                "title": f"Submenu {i_submenu}",
+                "dishes": [
+                    {**data_dish, "title": f"Dish {i_dish}"}
+                    for i_dish in range(dishes_count)
+                ],
+            }
+            for i_submenu in range(submenus_count)
+        ],
+    }
+
+
+class TestBulk:
+    def test_import(self, client: TestClient, cache: Redis):
+        client.get("/")
+        assert cache.exists(versioned_key(MENUS_KEY, [0])) == 1
+
+        response = client.post(
+            "/bulk",
+            json=[
+                menu_import(data_menu, 3, 4),
+                menu_import(data_up_menu, 0, 0),
+            ],
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        menus = response.json()
+        assert [menu["title"] for menu in menus] == [
+            data_menu["title"],
+            data_up_menu["title"],
+        ]
+        assert menus[0]["submenus_count"] == 3
+        assert menus[0]["dishes_count"] == 12
+        assert cache.get(MENUS_VERSION) == b"1"
+        assert len(client.get("/").json()) == 2
+
+        menu = client.get(f"/{menus[0]['id']}").json()
+        assert menu["submenus_count"] == 3
+        assert menu["dishes_count"] == 12
+        tree = client.get(f"/{menus[0]['id']}/tree").json()
+        assert len(tree["submenus"]) == 3
+        assert all(
+            submenu["dishes_count"] == 4 for submenu in tree["submenus"]
+        )
+        assert all(len(submenu["dishes"]) == 4 for submenu in tree["submenus"])
+
+    def test_import_ndjson(self, client: TestClient):
+        content = "\n".join(
+            json.dumps(menu_import(menu, 2, 2))
+            for menu in (data_menu, data_up_menu)
+        )
+        response = client.post(
+            "/bulk",
+            content=content,
+            headers={"content-type": NDJSON_MEDIA_TYPE},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [menu["dishes_count"] for menu in response.json()] == [4, 4]
+        assert len(client.get("/").json()) == 2
+
+    def test_import_invalid(self, client: TestClient):
+        content = "\n".join(
+            (
+                json.dumps(data_menu),
+                "",
+                json.dumps({"title": "No description"}),
+            ),
+        )
+        response = client.post(
+            "/bulk",
+            content=content,
+            headers={"content-type": NDJSON_MEDIA_TYPE},
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert response.json()["detail"][0]["loc"] == [
+            "body",
+            3,
+            "description",
+        ]
+        assert client.get("/").json() == []
+
+    def test_import_duplicate_title(self, client: TestClient):
+        client.post("/", json=data_menu)
+        response = client.post(
+            "/bulk",
+            json=[menu_import(data_up_menu, 1, 1), data_menu],
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == TITLE_REGISTERED
+        assert len(client.get("/").json()) == 1
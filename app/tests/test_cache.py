@@ -1,80 +1,546 @@
+import asyncio
 import json
+import time
+from uuid import uuid4
 
+import pytest
+from anyio.abc import BlockingPortal
+from fastapi import status
 from fastapi.testclient import TestClient
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.asyncio.cluster import ClusterNode, NodesManager
+from redis.cluster import PRIMARY, REDIS_CLUSTER_HASH_SLOTS
+from redis.crc import key_slot
+from sqlalchemy import update
 
-from app.redis import get_redis
-from app.tests.data import data_dish, data_menu, data_submenu
+from app import crud, models
+from app.cache import (
+    DELETED_VERSION_TTL,
+    ETAG_HEADER,
+    INVALIDATE_CHANNEL,
+    MENUS_KEY,
+    MENUS_VERSION,
+    Script,
+    cache_response,
+    get_or_build,
+    invalidate,
+    latest_key,
+    listen_invalidations,
+    load_scripts,
+    local_cache,
+    local_versions,
+    menu_key,
+    menu_version,
+    prebuilt,
+    submenu_key,
+    submenu_version,
+    versioned_key,
+)
+from app.config import settings
+from app.redis import TimedRedisCluster
+from app.tests.data import (
+    data_dish,
+    data_menu,
+    data_submenu,
+    data_up_dish,
+    data_up_menu,
+    data_up_submenu,
+)
 
 
-class TestCache:
-    def test_cache(self, client: TestClient):
-        cache = get_redis()
+def version(cache: Redis, name: str) -> int:
+    return int(cache.get(name) or 0)
+
 
-        assert cache.exists("menus") == 0
+class TestCache:
+    def test_cache(self, client: TestClient, cache: Redis):
         menus_bd = client.get("")
-        assert cache.exists("menus") == 1
+        assert cache.hget(f"{MENUS_KEY}@0", "body") == menus_bd.content
         menus_cache = client.get("")
         assert menus_bd.content == menus_cache.content
 
-        new_menu = client.post("", json=data_menu)
-        assert cache.exists("menus") == 0
+        menu_id = client.post("", json=data_menu).json()["id"]
+        assert version(cache, MENUS_VERSION) == 1
+        assert len(client.get("").json()) == 1
 
-        menu_id = json.loads(new_menu.content)["id"]
-        assert cache.exists(f"menu:{menu_id}") == 0
         menu_bd = client.get(f"/{menu_id}")
-        assert cache.exists(f"menu:{menu_id}") == 1
+        assert cache.exists(f"{menu_key(menu_id)}@0") == 1
         menu_cache = client.get(f"/{menu_id}")
         assert menu_bd.content == menu_cache.content
+        client.get(f"/{menu_id}/submenus")
+        assert cache.exists(f"{menu_key(menu_id)}:submenus@0") == 1
 
-        assert cache.exists(f"menu:{menu_id}:submenus") == 0
-        submenus_bd = client.get(f"/{menu_id}/submenus")
-        assert cache.exists(f"menu:{menu_id}:submenus") == 1
-        submenus_cache = client.get(f"/{menu_id}/submenus")
-        assert submenus_bd.content == submenus_cache.content
-
-        new_submenu = client.post(f"/{menu_id}/submenus", json=data_submenu)
-        assert cache.exists(f"menu:{menu_id}:submenus") == 0
-
-        submenu_id = json.loads(new_submenu.content)["id"]
-        assert cache.exists(f"submenu:{submenu_id}") == 0
-        assert cache.llen(f"menu:{menu_id}:submenu.list") == 0
-        submenu_bd = client.get(f"/{menu_id}/submenus/{submenu_id}")
-        assert cache.exists(f"submenu:{submenu_id}") == 1
-        assert cache.llen(f"menu:{menu_id}:submenu.list") == 1
-        submenu_cache = client.get(f"/{menu_id}/submenus/{submenu_id}")
-        assert submenu_bd.content == submenu_cache.content
+        submenu_id = client.post(
+            f"/{menu_id}/submenus",
+            json=data_submenu,
+        ).json()["id"]
+        assert version(cache, menu_version(menu_id)) == 1
+        assert client.get(f"/{menu_id}").json()["submenus_count"] == 1
+        assert client.get("").json()[0]["submenus_count"] == 1
+        assert len(client.get(f"/{menu_id}/submenus").json()) == 1
 
-        assert cache.exists(f"submenu:{submenu_id}:dishes") == 0
-        dishes_bd = client.get(f"/{menu_id}/submenus/{submenu_id}/dishes")
-        assert cache.exists(f"submenu:{submenu_id}:dishes") == 1
-        dishes_cache = client.get(f"/{menu_id}/submenus/{submenu_id}/dishes")
-        assert dishes_bd.content == dishes_cache.content
+        submenu_path = f"/{menu_id}/submenus/{submenu_id}"
+        key = submenu_key(menu_id, submenu_id)
+        submenu_bd = client.get(submenu_path)
+        assert cache.exists(f"{key}@1.0") == 1
+        submenu_cache = client.get(submenu_path)
+        assert submenu_bd.content == submenu_cache.content
+        assert client.get(f"{submenu_path}/dishes").json() == []
 
-        new_dish = client.post(
-            f"/{menu_id}/submenus/{submenu_id}/dishes",
+        dish_id = client.post(
+            f"{submenu_path}/dishes",
             json=data_dish,
+        ).json()["id"]
+        assert client.get(f"/{menu_id}").json()["dishes_count"] == 1
+        assert client.get("").json()[0]["dishes_count"] == 1
+        assert client.get(submenu_path).json()["dishes_count"] == 1
+        assert len(client.get(f"{submenu_path}/dishes").json()) == 1
+
+        dish_path = f"{submenu_path}/dishes/{dish_id}"
+        dish_bd = client.get(dish_path)
+        assert cache.exists(f"{key}:dish:{dish_id}@2.0") == 1
+        dish_cache = client.get(dish_path)
+        assert dish_bd.content == dish_cache.content
+
+        # A dish change leaves the menu and its submenu lists cached.
+        client.patch(dish_path, json=data_up_dish)
+        assert version(cache, submenu_version(menu_id, submenu_id)) == 1
+        assert version(cache, menu_version(menu_id)) == 2
+        assert client.get(dish_path).json()["title"] == data_up_dish["title"]
+        dishes = client.get(f"{submenu_path}/dishes").json()
+        assert dishes[0]["title"] == data_up_dish["title"]
+
+        client.patch(submenu_path, json=data_up_submenu)
+        assert client.get(submenu_path).json()["title"] == (
+            data_up_submenu["title"]
         )
-        assert cache.exists(f"submenu:{submenu_id}:dishes") == 0
+        submenus = client.get(f"/{menu_id}/submenus").json()
+        assert submenus[0]["title"] == data_up_submenu["title"]
 
-        dish_id = json.loads(new_dish.content)["id"]
-        assert cache.exists(f"dish:{dish_id}") == 0
-        assert cache.llen(f"menu:{menu_id}:dish.list") == 0
-        dish_bd = client.get(
-            f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        client.patch(f"/{menu_id}", json=data_up_menu)
+        assert client.get("").json()[0]["title"] == data_up_menu["title"]
+
+        client.delete(f"/{menu_id}")
+        assert client.get("").json() == []
+        assert client.get(f"/{menu_id}").status_code == (
+            status.HTTP_404_NOT_FOUND
         )
-        assert cache.exists(f"dish:{dish_id}") == 1
-        assert cache.llen(f"menu:{menu_id}:dish.list") == 1
-        dish_cache = client.get(
-            f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+        assert client.get(dish_path).status_code == status.HTTP_404_NOT_FOUND
+        for name in (
+            menu_version(menu_id),
+            submenu_version(menu_id, submenu_id),
+        ):
+            assert 0 < cache.ttl(name) <= DELETED_VERSION_TTL
+
+    def test_cache_bounded(self, client: TestClient, cache: Redis):
+        menu_id = client.post("", json=data_menu).json()["id"]
+        paths = [f"/{menu_id}", f"/{menu_id}/submenus"]
+        for i_submenu in range(3):
+            submenu_id = client.post(
+                f"/{menu_id}/submenus",
+                json={**data_submenu, "title": f"Title {i_submenu}"},
+            ).json()["id"]
+            paths.append(f"/{menu_id}/submenus/{submenu_id}")
+            paths.append(f"/{menu_id}/submenus/{submenu_id}/dishes")
+            for i_dish in range(3):
+                dish_id = client.post(
+                    f"/{menu_id}/submenus/{submenu_id}/dishes",
+                    json={**data_dish, "title": f"Title {i_dish}"},
+                ).json()["id"]
+                paths.append(
+                    f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+                )
+
+        for _ in range(5):
+            for path in paths:
+                client.get(path)
+
+        # One key per read resource, each with a pointer to its latest
+        # version.
+        assert len(list(cache.scan_iter("menu:*"))) == len(paths)
+        assert len(list(cache.scan_iter("latest:*"))) == len(paths)
+        for key in cache.scan_iter():
+            if key.startswith(b"version:"):
+                assert cache.ttl(key) == -1
+            else:
+                assert 0 < cache.ttl(key) <= settings.CACHE_TTL
+
+    def test_single_flight(
+        self,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+    ):
+        builds = []
+
+        async def build():
+            builds.append(1)
+            await asyncio.sleep(0.05)
+            return data_menu, None
+
+        async def read_concurrently():
+            return await asyncio.gather(
+                *(
+                    get_or_build(cache_pool, MENUS_KEY, build)
+                    for _ in range(10)
+                ),
+            )
+
+        responses = portal.call(read_concurrently)
+        assert len(builds) == 1
+        assert all(json.loads(r.body) == data_menu for r in responses)
+
+    def test_single_flight_cancelled(
+        self,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+    ):
+        builds = []
+
+        async def build():
+            builds.append(1)
+            if len(builds) == 1:
+                await asyncio.sleep(60)
+            return data_menu, None
+
+        async def cancel_leader():
+            leader = asyncio.create_task(
+                get_or_build(cache_pool, MENUS_KEY, build),
+            )
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(
+                get_or_build(cache_pool, MENUS_KEY, build),
+            )
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.wait_for(follower, 1)
+
+        response = portal.call(cancel_leader)
+        assert len(builds) == 2
+        assert json.loads(response.body) == data_menu
+
+    def test_stale_while_revalidate(
+        self,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+        cache: Redis,
+    ):
+        async def build():
+            return data_up_menu, None
+
+        async def read():
+            return await get_or_build(
+                cache_pool,
+                MENUS_KEY,
+                build,
+                versions=[MENUS_VERSION],
+            )
+
+        portal.call(
+            cache_response,
+            cache_pool,
+            f"{MENUS_KEY}@0",
+            data_menu,
+            "",
+            None,
+            settings.CACHE_TTL,
+            latest_key(MENUS_KEY),
         )
-        assert dish_bd.content == dish_cache.content
+        portal.call(invalidate, cache_pool, MENUS_VERSION)
+        assert cache.get(latest_key(MENUS_KEY)) == f"{MENUS_KEY}@0".encode()
 
-        client.delete(f"/{menu_id}")
-        assert cache.exists("menus") == 0
-        assert cache.exists(f"menu:{menu_id}") == 0
-        assert cache.exists(f"menu:{menu_id}:submenus") == 0
-        assert cache.exists(f"submenu:{submenu_id}") == 0
-        assert cache.llen(f"menu:{menu_id}:submenu.list") == 0
-        assert cache.exists(f"submenu:{submenu_id}:dishes") == 0
-        assert cache.exists(f"dish:{dish_id}") == 0
-        assert cache.llen(f"menu:{menu_id}:dish.list") == 0
+        cache.set(f"lock:{MENUS_KEY}@1:", "another worker", ex=5)
+        assert json.loads(portal.call(read).body) == data_menu
+        assert cache.exists(f"{MENUS_KEY}@1") == 0
+
+        cache.delete(f"lock:{MENUS_KEY}@1:")
+        assert json.loads(portal.call(read).body) == data_up_menu
+        assert cache.get(latest_key(MENUS_KEY)) == f"{MENUS_KEY}@1".encode()
+
+    def test_local_cache(
+        self,
+        client: TestClient,
+        cache: Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        monkeypatch.setattr(local_cache, "maxsize", 10)
+        monkeypatch.setattr(local_versions, "maxsize", 10)
+        local_cache.clear()
+        local_versions.clear()
+
+        menus_bd = client.get("")
+        cache.delete(f"{MENUS_KEY}@0", MENUS_VERSION)
+        cache.set(MENUS_VERSION, 5)
+        menus_local = client.get("")
+        assert menus_local.content == menus_bd.content
+        assert cache.exists(f"{MENUS_KEY}@0") == 0
+
+        client.post("", json=data_menu)
+        assert len(client.get("").json()) == 1
+
+    def test_local_cache_pubsub(
+        self,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+        cache: Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        monkeypatch.setattr(local_versions, "maxsize", 10)
+        listener = portal.start_task_soon(listen_invalidations, cache_pool)
+        try:
+            while not cache.pubsub_numsub(INVALIDATE_CHANNEL)[0][1]:
+                time.sleep(0.01)
+            local_versions.set(MENUS_VERSION, 0)
+            assert local_versions.get(MENUS_VERSION) == 0
+
+            cache.publish(INVALIDATE_CHANNEL, f"{MENUS_VERSION}\nother")
+            for _ in range(100):
+                if local_versions.get(MENUS_VERSION) is None:
+                    break
+                time.sleep(0.01)
+            assert local_versions.get(MENUS_VERSION) is None
+        finally:
+            listener.cancel()
+            local_versions.clear()
+
+    def test_script(
+        self,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        portal.call(cache_pool.script_flush)
+        commands = []
+        execute_command = cache_pool.execute_command
+
+        async def record(*args, **options):
+            commands.append(args[0])
+            return await execute_command(*args, **options)
+
+        monkeypatch.setattr(cache_pool, "execute_command", record)
+        script = Script("return ARGV[1]")
+        for _ in range(2):
+            assert portal.call(script, cache_pool, [], ["value"]) == b"value"
+        # Loaded on NOSCRIPT, then called by its SHA1 only.
+        assert commands == ["EVALSHA", "SCRIPT LOAD", "EVALSHA", "EVALSHA"]
+
+    def test_key_slots(
+        self,
+        client: TestClient,
+        cache_pool: aioredis.Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        # Each read script touches one Redis Cluster slot.
+        scripts = []
+        execute_command = cache_pool.execute_command
+
+        async def record(*args, **options):
+            if args[0] == "EVALSHA":
+                scripts.append(args[3 : 3 + args[2]])  # noqa: E203
+            return await execute_command(*args, **options)
+
+        monkeypatch.setattr(cache_pool, "execute_command", record)
+        menu_id = client.post("", json=data_menu).json()["id"]
+        submenu_path = f"/{menu_id}/submenus/" + (
+            client.post(f"/{menu_id}/submenus", json=data_submenu).json()["id"]
+        )
+        dish_id = client.post(
+            f"{submenu_path}/dishes",
+            json=data_dish,
+        ).json()["id"]
+        scripts.clear()
+        for path in (
+            "",
+            "/tree",
+            f"/{menu_id}",
+            f"/{menu_id}/tree",
+            f"/{menu_id}/submenus",
+            submenu_path,
+            f"{submenu_path}/dishes",
+            f"{submenu_path}/dishes/{dish_id}",
+        ):
+            client.get(path)
+        assert len(scripts) == 8
+        for keys in scripts:
+            assert len({key_slot(key.encode()) for key in keys}) == 1, keys
+
+    def test_cluster(
+        self,
+        portal: BlockingPortal,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        async def initialize(nodes: NodesManager):
+            # The test redis is no cluster: one primary serves every slot.
+            node = ClusterNode(
+                settings.REDIS_SERVER,
+                int(settings.REDIS_PORT),
+                PRIMARY,
+                **nodes.connection_kwargs,
+            )
+            nodes.nodes_cache = {node.name: node}
+            nodes.slots_cache = dict.fromkeys(
+                range(REDIS_CLUSTER_HASH_SLOTS),
+                [node],
+            )
+            nodes.default_node = node
+
+        monkeypatch.setattr(NodesManager, "initialize", initialize)
+        cluster = TimedRedisCluster(
+            host=settings.REDIS_SERVER,
+            port=settings.REDIS_PORT,
+        )
+        menu_id = str(uuid4())
+        key = menu_key(menu_id)
+        versions = [menu_version(menu_id)]
+
+        async def build():
+            return {"id": menu_id}, None
+
+        async def write_and_read():
+            try:
+                await load_scripts(cluster)
+                await invalidate(cluster, *versions)
+                first = await get_or_build(cluster, key, build, versions)
+                second = await get_or_build(
+                    cluster,
+                    key,
+                    prebuilt(None),
+                    versions,
+                )
+                return first, second
+            finally:
+                # Cluster clients use db 0.
+                keys = await cluster.keys(f"*{menu_id}*")
+                if keys:
+                    await cluster.delete(*keys)
+                await cluster.close()
+
+        first, second = portal.call(write_and_read)
+        assert json.loads(first.body) == {"id": menu_id}
+        assert second.body == first.body
+
+    def test_etag(self, client: TestClient, cache: Redis):
+        response = client.get("")
+        etag = response.headers[ETAG_HEADER]
+        assert json.loads(
+            cache.hget(versioned_key(MENUS_KEY, [0]), "headers")
+        ) == {
+            ETAG_HEADER: etag,
+        }
+
+        for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = client.get("", headers={"If-None-Match": if_none_match})
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response.content == b""
+            assert response.headers[ETAG_HEADER] == etag
+
+        response = client.get("", headers={"If-None-Match": '"other"'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers[ETAG_HEADER] == etag
+
+        client.post("", json=data_menu)
+        response = client.get("", headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+        assert response.headers[ETAG_HEADER] != etag
+
+    def test_round_trips(
+        self,
+        client: TestClient,
+        cache_pool: aioredis.Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        round_trips = []
+        execute_command = cache_pool.execute_command
+        pipeline = cache_pool.pipeline
+
+        async def counted_command(*args, **options):
+            round_trips.append(args[0])
+            return await execute_command(*args, **options)
+
+        def counted_pipeline(*args, **kwargs):
+            round_trips.append("pipeline")
+            return pipeline(*args, **kwargs)
+
+        monkeypatch.setattr(cache_pool, "execute_command", counted_command)
+        monkeypatch.setattr(cache_pool, "pipeline", counted_pipeline)
+
+        menu_id = client.post("", json=data_menu).json()["id"]
+        assert round_trips == ["pipeline"]
+
+        # Read, lock and write.
+        round_trips.clear()
+        client.get(f"/{menu_id}")
+        assert round_trips == ["EVALSHA", "pipeline", "pipeline"]
+
+        round_trips.clear()
+        client.get(f"/{menu_id}")
+        assert round_trips == ["EVALSHA"]
+
+    def test_write_through(
+        self,
+        client: TestClient,
+        cache: Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        monkeypatch.setattr(settings, "CACHE_WRITE_THROUGH", True)
+        menu_id = client.post("", json=data_menu).json()["id"]
+        assert cache.exists(f"{menu_key(menu_id)}@0", f"{MENUS_KEY}@1") == 2
+
+        submenu = client.post(f"/{menu_id}/submenus", json=data_submenu)
+        submenu_id = submenu.json()["id"]
+        key = submenu_key(menu_id, submenu_id)
+        written = cache.exists(
+            f"{key}@1.0",
+            f"{menu_key(menu_id)}:submenus@1",
+            f"{menu_key(menu_id)}@1",
+            f"{MENUS_KEY}@2",
+        )
+        assert written == 4
+
+        response = client.get(f"/{menu_id}/submenus/{submenu_id}")
+        assert response.content == submenu.content
+        menus = json.loads(cache.hget(f"{MENUS_KEY}@2", "body"))
+        assert menus[0]["submenus_count"] == 1
+
+        client.patch(f"/{menu_id}", json=data_up_menu)
+        menu = json.loads(cache.hget(f"{menu_key(menu_id)}@2", "body"))
+        assert menu["title"] == data_up_menu["title"]
+
+        patch_menu = crud.patch_menu
+
+        async def patch_menu_concurrently(db, db_menu, menu):
+            # A submenu counted by another request after db_menu was read.
+            await db.execute(
+                update(models.Menu)
+                .where(models.Menu.id == db_menu.id)
+                .values(submenus_count=models.Menu.submenus_count + 1)
+                .execution_options(synchronize_session=False),
+            )
+            return await patch_menu(db, db_menu, menu)
+
+        monkeypatch.setattr(crud, "patch_menu", patch_menu_concurrently)
+        client.patch(f"/{menu_id}", json=data_menu)
+        menu = json.loads(cache.hget(f"{menu_key(menu_id)}@3", "body"))
+        assert menu["submenus_count"] == 2
+
+        dishes_path = f"/{menu_id}/submenus/{submenu_id}/dishes"
+        dish_id = client.post(dishes_path, json=data_dish).json()["id"]
+        patch_dish = crud.patch_dish
+
+        async def patch_dish_concurrently(db, db_dish, dish):
+            db_dish = await patch_dish(db, db_dish, dish)
+            # Another update committed before this one is cached.
+            await db.execute(
+                update(models.Dish)
+                .where(models.Dish.id == db_dish.id)
+                .values(description=data_up_dish["description"])
+                .execution_options(synchronize_session=False),
+            )
+            await db.commit()
+            return db_dish
+
+        monkeypatch.setattr(crud, "patch_dish", patch_dish_concurrently)
+        client.patch(f"{dishes_path}/{dish_id}", json=data_dish)
+        response = client.get(f"{dishes_path}/{dish_id}")
+        assert response.json()["description"] == data_up_dish["description"]
@@ -37,3 +37,30 @@ class TestCount:
         assert response.status_code == status.HTTP_200_OK
         assert response.json()["submenus_count"] == count_submenu
         assert response.json()["dishes_count"] == count_submenu * count_dish
+
+    def test_count_after_delete(self, client: TestClient):
+        datacopy_dish = copy.deepcopy(data_dish)
+
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        submenu_id = client.post(
+            f"/{menu_id}/submenus",
+            json=data_submenu,
+        ).json()["id"]
+        dish_ids = []
+        for i_dish in range(1, 4):
+            datacopy_dish["title"] = f"Title {i_dish}"
+            dish = client.post(
+                f"/{menu_id}/submenus/{submenu_id}/dishes",
+                json=datacopy_dish,
+            )
+            dish_ids.append(dish.json()["id"])
+
+        client.delete(f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_ids[0]}")
+        submenu = client.get(f"/{menu_id}/submenus/{submenu_id}")
+        assert submenu.json()["dishes_count"] == 2
+        assert client.get(f"/{menu_id}").json()["dishes_count"] == 2
+
+        client.delete(f"/{menu_id}/submenus/{submenu_id}")
+        response = client.get(f"/{menu_id}")
+        assert response.json()["submenus_count"] == 0
+        assert response.json()["dishes_count"] == 0
@@ -1,5 +1,8 @@
+from uuid import uuid4
+
 from fastapi import status
 from fastapi.testclient import TestClient
+from redis import Redis
 
 from app.api.api_v1.menu import DISH_NOT_F, TITLE_REGISTERED
 from app.crud import DEL_DISH_RESULT
@@ -30,6 +33,14 @@ class TestDish:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json()["detail"] == DISH_NOT_F
 
+    def test_missing_submenu_dishes(self, client: TestClient, cache: Redis):
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        for submenu_id in (str(uuid4()), "not_found", "{not_found}"):
+            response = client.get(f"/{menu_id}/submenus/{submenu_id}/dishes")
+            assert response.status_code == status.HTTP_200_OK
+            assert response.json() == []
+        assert cache.keys("*not_found*") == []
+
     def test_empty_dishes(self, client: TestClient):
         menu = client.post("/", json=data_menu)
         menu_id = menu.json()["id"]
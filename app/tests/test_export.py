@@ -0,0 +1,75 @@
+import csv
+import json
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.export import CSV_COLUMNS
+from app.tests.data import data_dish, data_menu, data_submenu, data_up_menu
+
+
+class TestExport:
+    def test_empty_export(self, client: TestClient):
+        response = client.get("/export")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.text == ""
+        response = client.get("/export", params={"format": "csv"})
+        assert response.text.splitlines() == [",".join(CSV_COLUMNS)]
+
+    def test_export(self, client: TestClient):
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        submenu_id = client.post(
+            f"/{menu_id}/submenus",
+            json=data_submenu,
+        ).json()["id"]
+        client.post(
+            f"/{menu_id}/submenus", json={**data_submenu, "title": "2"}
+        )
+        dish_ids = [
+            client.post(
+                f"/{menu_id}/submenus/{submenu_id}/dishes",
+                json={**data_dish, "title": f"Title {i_dish}"},
+            ).json()["id"]
+            for i_dish in range(3)
+        ]
+        client.post("/", json=data_up_menu)
+
+        response = client.get("/export")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        menus = [json.loads(line) for line in response.text.splitlines()]
+        assert len(menus) == 2
+        menu = next(menu for menu in menus if menu["id"] == menu_id)
+        assert len(menu["submenus"]) == 2
+        submenu = next(
+            submenu
+            for submenu in menu["submenus"]
+            if submenu["id"] == submenu_id
+        )
+        assert sorted(dish["id"] for dish in submenu["dishes"]) == sorted(
+            dish_ids,
+        )
+
+        response = client.get("/export", params={"format": "csv"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(response.text.splitlines()))
+        # Three dishes, a submenu and a menu without dishes.
+        assert len(rows) == 5
+        assert sorted(row["dish_id"] for row in rows if row["dish_id"]) == (
+            sorted(dish_ids)
+        )
+
+    def test_export_is_importable(self, client: TestClient):
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        client.post(f"/{menu_id}/submenus", json=data_submenu)
+        exported = client.get("/export").text
+        client.delete(f"/{menu_id}")
+
+        response = client.post(
+            "/bulk",
+            content=exported,
+            headers={"content-type": "application/x-ndjson"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.json()[0]["submenus_count"] == 1
@@ -1,8 +1,23 @@
-from fastapi import status
+import pytest
+from anyio.abc import BlockingPortal
+from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
+from redis import Redis
+from redis import asyncio as aioredis
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.api_v1.menu import MENU_NOT_F, TITLE_REGISTERED
+from app.api.api_v1.menu import (
+    FOREIGN_KEY_VIOLATION,
+    MENU_NOT_F,
+    TITLE_REGISTERED,
+    UNIQUE_VIOLATION,
+    unique_title,
+)
+from app.cache import MENUS_KEY, MENUS_VERSION, versioned_key
+from app.config import settings
 from app.crud import DEL_MENU_RESULT
+from app.pagination import INVALID_CURSOR, NEXT_CURSOR_HEADER
 from app.tests.data import (
     data_description,
     data_menu,
@@ -19,6 +34,34 @@ class TestMenu:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.json()["detail"] == MENU_NOT_F
 
+    def test_not_id(
+        self,
+        client: TestClient,
+        cache_pool: aioredis.Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        # Ids of another form never reach the cache keys.
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        commands = []
+        execute_command = cache_pool.execute_command
+
+        async def record(*args, **options):
+            commands.append(args[0])
+            return await execute_command(*args, **options)
+
+        monkeypatch.setattr(cache_pool, "execute_command", record)
+        for path in (
+            f"/{{{menu_id}}}",
+            f"/{menu_id.upper()}",
+            f"/{menu_id}}}/tree",
+        ):
+            response = client.get(path)
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+            assert response.json()["detail"] == MENU_NOT_F
+        response = client.patch(f"/{menu_id}{{x}}", json=data_up_menu)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert commands == []
+
     def test_empty_menus(self, client: TestClient):
         response = client.get("/")
         assert response.status_code == status.HTTP_200_OK
@@ -31,6 +74,12 @@ class TestMenu:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.json()["detail"] == TITLE_REGISTERED
 
+        other_menu = client.post("/", json=data_up_menu)
+        response = client.patch(f"/{other_menu.json()['id']}", json=data_menu)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == TITLE_REGISTERED
+        assert len(client.get("/").json()) == 2
+
     def test_crud_menu(self, client):
         menu = client.post("/", json=data_menu)
         assert menu.status_code == status.HTTP_201_CREATED
@@ -68,3 +117,66 @@ class TestMenu:
         response = client.get("/")
         assert response.status_code == status.HTTP_200_OK
         assert response.json() == []
+
+    def test_pagination(
+        self,
+        client: TestClient,
+        cache: Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        monkeypatch.setattr(settings, "PAGE_SIZES_CACHED", [2])
+        menu_ids = sorted(
+            client.post(
+                "/",
+                json={"title": f"Title {i}", "description": data_description},
+            ).json()["id"]
+            for i in range(5)
+        )
+
+        response = client.get("/", params={"limit": 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert [menu["id"] for menu in response.json()] == menu_ids[:2]
+        cursor = response.headers[NEXT_CURSOR_HEADER]
+
+        response = client.get("/", params={"limit": 2, "cursor": cursor})
+        assert [menu["id"] for menu in response.json()] == menu_ids[2:4]
+        cursor = response.headers[NEXT_CURSOR_HEADER]
+
+        response = client.get("/", params={"limit": 2, "cursor": cursor})
+        assert [menu["id"] for menu in response.json()] == menu_ids[4:]
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+        cached = client.get("/", params={"limit": 2})
+        assert [menu["id"] for menu in cached.json()] == menu_ids[:2]
+        assert NEXT_CURSOR_HEADER in cached.headers
+        client.get("/", params={"limit": 3})
+        # Only the first page of a cached size is stored.
+        key = versioned_key(MENUS_KEY, [int(cache.get(MENUS_VERSION))])
+        assert sorted(cache.hkeys(key)) == [b"body:2", b"headers:2"]
+
+        response = client.get("/", params={"cursor": "%%%"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == INVALID_CURSOR
+
+    def test_unique_title(
+        self,
+        portal: BlockingPortal,
+        db_session: AsyncSession,
+    ):
+        async def violate(sqlstate: str, parent_not_found: str | None = None):
+            error = Exception()
+            error.sqlstate = sqlstate
+            async with unique_title(db_session, parent_not_found):
+                raise IntegrityError("INSERT", {}, error)
+
+        with pytest.raises(HTTPException) as raised:
+            portal.call(violate, UNIQUE_VIOLATION)
+        assert raised.value.detail == TITLE_REGISTERED
+        # A foreign key violation is not a duplicate title.
+        with pytest.raises(IntegrityError):
+            portal.call(violate, FOREIGN_KEY_VIOLATION)
+        # Unless the parent was deleted meanwhile.
+        with pytest.raises(HTTPException) as raised:
+            portal.call(violate, FOREIGN_KEY_VIOLATION, MENU_NOT_F)
+        assert raised.value.status_code == status.HTTP_404_NOT_FOUND
+        assert raised.value.detail == MENU_NOT_F
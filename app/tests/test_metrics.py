@@ -0,0 +1,93 @@
+from fastapi import FastAPI, status
+from fastapi.testclient import TestClient
+
+from app.cache import (
+    MENUS_KEY,
+    MENUS_VERSION,
+    menu_key,
+    menu_tree_key,
+    menu_version,
+    submenu_key,
+    submenu_version,
+)
+from app.metrics import (
+    CONTENT_TYPE,
+    MetricsMiddleware,
+    key_family,
+    render,
+    router,
+)
+from app.tests.data import data_menu
+
+
+def sample(text: str, name: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(f"{name} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+class TestMetrics:
+    def test_key_family(self):
+        menu, submenu = menu_key("1"), submenu_key("1", "2")
+        assert key_family(MENUS_KEY) == "menus"
+        assert key_family(f"{MENUS_KEY}:tree@3") == "menus"
+        assert key_family(f"{menu}@3") == "menu"
+        assert key_family(f"{menu_tree_key('1')}@3") == "menu"
+        assert key_family(f"{menu}:submenus@3") == "submenu"
+        assert key_family(f"{submenu}@3.1") == "submenu"
+        assert key_family(f"{submenu}:dishes@3.1") == "dish"
+        assert key_family(f"{submenu}:dish:3@3.1") == "dish"
+        assert key_family(MENUS_VERSION) == "menus"
+        assert key_family(menu_version("1")) == "menu"
+        assert key_family(submenu_version("1", "2")) == "submenu"
+
+    def test_endpoint(self):
+        app = FastAPI()
+        app.include_router(router)
+        response = TestClient(app).get("/metrics")
+        assert response.headers["content-type"].startswith(CONTENT_TYPE)
+        assert "# TYPE cache_hits_total counter" in response.text
+
+    def test_metrics(self, app: FastAPI, client: TestClient):
+        app.add_middleware(MetricsMiddleware)
+        before = render()
+
+        menu_id = client.post("", json=data_menu).json()["id"]
+        client.get(f"/{menu_id}")
+        client.get(f"/{menu_id}")
+        assert client.get(f"/{menu_id}/unknown").status_code == (
+            status.HTTP_404_NOT_FOUND
+        )
+
+        after = render()
+        for name, delta in (
+            ('cache_misses_total{family="menu"}', 1),
+            ('cache_hits_total{family="menu",source="redis"}', 1),
+            # The list and the tree of all menus.
+            ('cache_invalidations_total{family="menus"}', 2),
+            (
+                "http_request_duration_seconds_count"
+                '{method="GET",route="/{menu_id}",status="200"}',
+                2,
+            ),
+            (
+                "http_request_duration_seconds_count"
+                '{method="POST",route="/",status="201"}',
+                1,
+            ),
+            (
+                "http_request_duration_seconds_count"
+                '{method="GET",route="",status="404"}',
+                1,
+            ),
+            ('redis_command_duration_seconds_count{command="EVALSHA"}', 2),
+        ):
+            assert sample(after, name) - sample(before, name) == delta, name
+        assert sample(
+            after,
+            'db_query_duration_seconds_count{statement="insert"}',
+        ) > sample(
+            before,
+            'db_query_duration_seconds_count{statement="insert"}',
+        )
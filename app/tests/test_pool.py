@@ -0,0 +1,68 @@
+import pytest
+from anyio.abc import BlockingPortal
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis import asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import get_db
+
+
+class TestPool:
+    def test_connections(
+        self,
+        app: FastAPI,
+        client: TestClient,
+        portal: BlockingPortal,
+        cache_pool: aioredis.Redis,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        # Sessions of their own, as the application opens them, instead
+        # of the one of the db_session fixture.
+        engine = create_async_engine(
+            settings.ASYNC_DATABASE_URL,
+            poolclass=NullPool,
+        )
+        sessions = sessionmaker(
+            bind=engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+        )
+
+        async def get_session():
+            async with sessions() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = get_session
+        events = []
+        event.listen(
+            engine.sync_engine,
+            "checkout",
+            lambda *args: events.append("checkout"),
+        )
+        event.listen(
+            engine.sync_engine,
+            "checkin",
+            lambda *args: events.append("checkin"),
+        )
+        pipeline = cache_pool.pipeline
+
+        def traced_pipeline(*args, **kwargs):
+            events.append("pipeline")
+            return pipeline(*args, **kwargs)
+
+        monkeypatch.setattr(cache_pool, "pipeline", traced_pipeline)
+        try:
+            # The connection is returned before the response is cached.
+            client.get("")
+            assert events == ["pipeline", "checkout", "checkin", "pipeline"]
+
+            events.clear()
+            client.get("")
+            assert events == []
+        finally:
+            portal.call(engine.dispose)
@@ -0,0 +1,142 @@
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from redis import Redis
+
+from app.tests.data import (
+    data_dish,
+    data_menu,
+    data_submenu,
+    data_up_dish,
+    data_up_menu,
+    data_up_submenu,
+)
+from app.tests.test_bulk import menu_import
+from app.tracing import Trace
+
+MaxQueries = Callable[[int], AbstractContextManager[list[Trace]]]
+
+# Submenus per menu and dishes per submenu. Counts must not depend on it.
+CATALOG_SIZES = [(1, 1), (3, 5)]
+
+MENU = "/{menu_id}"
+SUBMENU = "/{menu_id}/submenus/{submenu_id}"
+DISH = "/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}"
+
+# SQL statements and redis calls of a read on a cold and on a warm cache.
+# A cold read looks the entry up, takes the lock and writes the entry.
+READS = {
+    "": ((1, 3), (0, 1)),
+    "/tree": ((3, 3), (0, 1)),
+    MENU: ((1, 3), (0, 1)),
+    f"{MENU}/tree": ((3, 3), (0, 1)),
+    f"{MENU}/submenus": ((2, 3), (0, 1)),
+    SUBMENU: ((1, 3), (0, 1)),
+    f"{SUBMENU}/dishes": ((2, 3), (0, 1)),
+    DISH: ((1, 3), (0, 1)),
+    "/export?format=ndjson": ((1, 0), (1, 0)),
+    "/export?format=csv": ((1, 0), (1, 0)),
+}
+
+# Method, path, body and the SQL statements and redis calls of a write.
+# Every write invalidates the cache in one round trip.
+WRITES = [
+    ("post", "", data_up_menu, (1, 1)),
+    ("patch", MENU, data_up_menu, (2, 1)),
+    ("post", f"{MENU}/submenus", {**data_submenu, "title": "New"}, (3, 1)),
+    ("patch", SUBMENU, data_up_submenu, (2, 1)),
+    ("post", f"{SUBMENU}/dishes", {**data_dish, "title": "New"}, (4, 1)),
+    ("patch", DISH, data_up_dish, (2, 1)),
+    ("delete", DISH, None, (4, 1)),
+    ("delete", SUBMENU, None, (4, 1)),
+    ("delete", MENU, None, (5, 1)),
+]
+
+
+def counts(trace: Trace) -> tuple[int, int]:
+    return len(trace.queries), len(trace.redis)
+
+
+@pytest.fixture(scope="function", params=CATALOG_SIZES, ids=str)
+def catalog(
+    request: pytest.FixtureRequest,
+    client: TestClient,
+    cache: Redis,
+) -> dict[str, str]:
+    """Import menus, the last of the given size, leaving the cache cold.
+
+    Returns the ids of the last menu, submenu and dish.
+    """
+    submenus_count, dishes_count = request.param
+    client.post("/bulk", json=[menu_import(data_menu, 0, 0)])
+    last_menu = menu_import(
+        {**data_menu, "title": "Catalog"},
+        submenus_count,
+        dishes_count,
+    )
+    menu_id = client.post("/bulk", json=[last_menu]).json()[0]["id"]
+    submenu_path = f"/{menu_id}/submenus"
+    submenu_id = client.get(submenu_path).json()[-1]["id"]
+    dishes = client.get(f"{submenu_path}/{submenu_id}/dishes").json()
+    cache.flushdb()
+    return {
+        "menu_id": menu_id,
+        "submenu_id": submenu_id,
+        "dish_id": dishes[-1]["id"],
+    }
+
+
+class TestQueries:
+    @pytest.mark.parametrize("route", READS)
+    def test_read(
+        self,
+        client: TestClient,
+        catalog: dict[str, str],
+        assert_max_queries: MaxQueries,
+        route: str,
+    ):
+        cold, warm = READS[route]
+        path = route.format(**catalog)
+        with assert_max_queries(cold[0]) as traces:
+            assert client.get(path).status_code == status.HTTP_200_OK
+            assert client.get(path).status_code == status.HTTP_200_OK
+        assert [counts(trace) for trace in traces] == [cold, warm]
+
+    @pytest.mark.parametrize(
+        "method, route, json, expected",
+        WRITES,
+        ids=[f"{method} {route}" for method, route, _, _ in WRITES],
+    )
+    def test_write(
+        self,
+        client: TestClient,
+        catalog: dict[str, str],
+        assert_max_queries: MaxQueries,
+        method: str,
+        route: str,
+        json: dict | None,
+        expected: tuple[int, int],
+    ):
+        path = route.format(**catalog)
+        kwargs = {} if json is None else {"json": json}
+        with assert_max_queries(expected[0]) as traces:
+            response = client.request(method, path, **kwargs)
+        assert response.status_code < status.HTTP_300_MULTIPLE_CHOICES
+        assert [counts(trace) for trace in traces] == [expected]
+
+    def test_bulk(
+        self,
+        client: TestClient,
+        catalog: dict[str, str],
+        assert_max_queries: MaxQueries,
+    ):
+        # One executemany per table, whatever the number of rows.
+        with assert_max_queries(3) as traces:
+            client.post(
+                "/bulk",
+                json=[menu_import({**data_menu, "title": "Bulk"}, 4, 6)],
+            )
+        assert [counts(trace) for trace in traces] == [(3, 1)]
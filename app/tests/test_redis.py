@@ -0,0 +1,40 @@
+import pytest
+from redis.exceptions import RedisClusterException
+
+from app.config import settings
+from app.redis import (
+    TimedClusterPipeline,
+    TimedRedisCluster,
+    create_pool,
+    get_redis,
+)
+
+
+class TestRedis:
+    def test_pool(self):
+        pool = create_pool()
+        assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        assert pool.timeout == settings.REDIS_POOL_TIMEOUT
+        options = pool.connection_kwargs
+        assert options["socket_timeout"] == settings.REDIS_SOCKET_TIMEOUT
+        assert options["health_check_interval"] == (
+            settings.REDIS_HEALTH_CHECK_INTERVAL
+        )
+        assert get_redis().connection_pool is get_redis().connection_pool
+
+    def test_sentinel_pool(self, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.setattr(
+            settings,
+            "REDIS_SENTINELS",
+            [("sentinel-1", 26379), ("sentinel-2", 26379)],
+        )
+        pool = create_pool()
+        assert pool.service_name == settings.REDIS_SENTINEL_MASTER
+        assert pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        assert len(pool.sentinel_manager.sentinels) == 2
+
+    def test_cluster_pipeline(self):
+        cluster = TimedRedisCluster(host="redis")
+        assert isinstance(cluster.pipeline(), TimedClusterPipeline)
+        with pytest.raises(RedisClusterException):
+            cluster.pipeline(transaction=True)
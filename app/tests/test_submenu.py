@@ -8,6 +8,7 @@ from app.tests.data import (
     data_sub_description,
     data_sub_title,
     data_submenu,
+    data_up_menu,
     data_up_sub_description,
     data_up_sub_title,
     data_up_submenu,
@@ -38,6 +39,16 @@ class TestSubmenu:
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.json()["detail"] == TITLE_REGISTERED
 
+    def test_same_title_in_other_menu(self, client: TestClient):
+        menu = client.post("/", json=data_menu)
+        client.post(f"/{menu.json()['id']}/submenus", json=data_submenu)
+        other_menu = client.post("/", json=data_up_menu)
+        response = client.post(
+            f"/{other_menu.json()['id']}/submenus",
+            json=data_submenu,
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
     def test_crud_submenu(self, client):
         menu = client.post("/", json=data_menu)
         menu_id = menu.json()["id"]
@@ -0,0 +1,64 @@
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.tests.data import data_menu
+from app.tracing import (
+    QUERIES_HEADER,
+    REDIS_CALLS_HEADER,
+    Trace,
+    TracingMiddleware,
+    recent_traces,
+    router,
+)
+
+MaxQueries = Callable[[int], AbstractContextManager[list[Trace]]]
+
+
+class TestTracing:
+    def test_trace(
+        self,
+        client: TestClient,
+        assert_max_queries: MaxQueries,
+    ):
+        menu_id = client.post("", json=data_menu).json()["id"]
+        with assert_max_queries(1) as traces:
+            cold = client.get(f"/{menu_id}")
+            warm = client.get(f"/{menu_id}")
+
+        assert [trace.route for trace in traces] == ["/{menu_id}"] * 2
+        assert len(traces[0].queries) == 1
+        assert traces[0].queries[0].name.lstrip().startswith("SELECT")
+        assert [call.name for call in traces[0].redis] == [
+            "EVALSHA",
+            "PIPELINE SET EXPIRE",
+            "PIPELINE HSET EXPIRE SET EVAL",
+        ]
+        # The header counts the savepoints of the db_session fixture too.
+        assert cold.headers[QUERIES_HEADER] == str(
+            len(recent_traces[-2].queries),
+        )
+        assert cold.headers[REDIS_CALLS_HEADER] == "3"
+        assert traces[1].queries == []
+        assert warm.headers[QUERIES_HEADER] == "0"
+        assert warm.headers[REDIS_CALLS_HEADER] == "1"
+
+        with pytest.raises(AssertionError, match="2 queries"):
+            with assert_max_queries(0):
+                client.get(f"/{menu_id}/submenus")
+
+    def test_recent_traces(self):
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware)
+        app.include_router(router)
+        client = TestClient(app)
+        client.get("/debug/requests")
+        # A request is kept once it is finished, the latest first.
+        trace = client.get("/debug/requests").json()[0]
+        assert trace["path"] == "/debug/requests"
+        assert trace["route"] == "/debug/requests"
+        assert trace["status"] == 200
+        assert len(recent_traces) <= recent_traces.maxlen
@@ -0,0 +1,118 @@
+from fastapi import status
+from fastapi.testclient import TestClient
+from redis import Redis
+
+from app.api.api_v1.menu import MENU_NOT_F
+from app.cache import (
+    MENUS_KEY,
+    MENUS_VERSION,
+    TREE_VERSION,
+    menu_tree_key,
+    menu_tree_version,
+    menu_version,
+    versioned_key,
+)
+from app.tests.data import (
+    data_description,
+    data_dish,
+    data_dish_title,
+    data_menu,
+    data_sub_title,
+    data_submenu,
+    data_title,
+    data_up_dish,
+    data_up_dish_title,
+)
+
+
+class TestTree:
+    def test_not_found(self, client: TestClient):
+        response = client.get("/not_found/tree")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()["detail"] == MENU_NOT_F
+
+    def test_empty_tree(self, client: TestClient):
+        response = client.get("/tree")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+
+    def test_tree_order(self, client: TestClient):
+        menu_ids = []
+        for number in range(3):
+            menu = {"title": f"Menu {number}", "description": data_description}
+            menu_ids.append(client.post("/", json=menu).json()["id"])
+        submenus_path = f"/{menu_ids[0]}/submenus"
+        submenu_ids = []
+        for number in range(3):
+            submenu = {
+                "title": f"Sub {number}",
+                "description": data_description,
+            }
+            submenu_ids.append(
+                client.post(submenus_path, json=submenu).json()["id"],
+            )
+        dishes_path = f"{submenus_path}/{submenu_ids[0]}/dishes"
+        dish_ids = []
+        for number in range(3):
+            dish = {**data_dish, "title": f"Dish {number}"}
+            dish_ids.append(client.post(dishes_path, json=dish).json()["id"])
+
+        tree = client.get("/tree").json()
+        assert [menu["id"] for menu in tree] == sorted(menu_ids)
+        menu = next(menu for menu in tree if menu["id"] == menu_ids[0])
+        assert [sub["id"] for sub in menu["submenus"]] == sorted(submenu_ids)
+        submenu = next(
+            sub for sub in menu["submenus"] if sub["id"] == submenu_ids[0]
+        )
+        assert [dish["id"] for dish in submenu["dishes"]] == sorted(dish_ids)
+
+    def test_tree(self, client: TestClient, cache: Redis):
+        menu_id = client.post("/", json=data_menu).json()["id"]
+        submenu_id = client.post(
+            f"/{menu_id}/submenus",
+            json=data_submenu,
+        ).json()["id"]
+        dish_id = client.post(
+            f"/{menu_id}/submenus/{submenu_id}/dishes",
+            json=data_dish,
+        ).json()["id"]
+
+        response = client.get("/tree")
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+        menu = response.json()[0]
+        assert menu["id"] == menu_id
+        assert menu["title"] == data_title
+        assert menu["submenus_count"] == 1
+        assert menu["dishes_count"] == 1
+        assert len(menu["submenus"]) == 1
+        submenu = menu["submenus"][0]
+        assert submenu["id"] == submenu_id
+        assert submenu["title"] == data_sub_title
+        assert submenu["dishes"][0]["id"] == dish_id
+        assert submenu["dishes"][0]["title"] == data_dish_title
+
+        response = client.get(f"/{menu_id}/tree")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == menu
+        version = int(cache.get(TREE_VERSION))
+        assert cache.exists(versioned_key(f"{MENUS_KEY}:tree", [version])) == 1
+        menu_versions = [int(cache.get(menu_version(menu_id))), 0]
+        menu_tree = versioned_key(menu_tree_key(menu_id), menu_versions)
+        assert cache.exists(menu_tree) == 1
+
+        # A dish change reaches the trees but not the list of menus.
+        menus_version = cache.get(MENUS_VERSION)
+        client.patch(
+            f"/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}",
+            json=data_up_dish,
+        )
+        assert cache.get(MENUS_VERSION) == menus_version
+        assert int(cache.get(TREE_VERSION)) == version + 1
+        assert int(cache.get(menu_tree_version(menu_id))) == 1
+        response = client.get(f"/{menu_id}/tree")
+        dish = response.json()["submenus"][0]["dishes"][0]
+        assert dish["title"] == data_up_dish_title
+        response = client.get("/tree")
+        dish = response.json()[0]["submenus"][0]["dishes"][0]
+        assert dish["title"] == data_up_dish_title
@@ -0,0 +1,89 @@
+from anyio.abc import BlockingPortal
+from fastapi.testclient import TestClient
+from redis import Redis
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import (
+    ETAG_HEADER,
+    MENUS_KEY,
+    latest_key,
+    menu_key,
+    submenu_key,
+    versioned_key,
+)
+from app.tests.data import data_dish, data_menu, data_submenu, data_up_menu
+from app.warmup import warm_up, warm_up_once
+
+
+class TestWarmUp:
+    def test_warm_up(
+        self,
+        client: TestClient,
+        portal: BlockingPortal,
+        db_session: AsyncSession,
+        cache_pool: aioredis.Redis,
+        cache: Redis,
+    ):
+        client.post("", json=data_up_menu)
+        menu_id = client.post("", json=data_menu).json()["id"]
+        submenu_id = client.post(
+            f"/{menu_id}/submenus",
+            json=data_submenu,
+        ).json()["id"]
+        client.post(
+            f"/{menu_id}/submenus/{submenu_id}/dishes",
+            json=data_dish,
+        )
+        submenu = submenu_key(menu_id, submenu_id)
+        # Versions were reset along with the cache.
+        keys = {
+            "": versioned_key(MENUS_KEY, [0]),
+            f"/{menu_id}": versioned_key(menu_key(menu_id), [0]),
+            f"/{menu_id}/submenus": versioned_key(
+                f"{menu_key(menu_id)}:submenus",
+                [0],
+            ),
+            f"/{menu_id}/submenus/{submenu_id}": versioned_key(
+                submenu,
+                [0, 0],
+            ),
+            f"/{menu_id}/submenus/{submenu_id}/dishes": versioned_key(
+                f"{submenu}:dishes",
+                [0, 0],
+            ),
+        }
+        responses = {path: client.get(path) for path in keys}
+        cache.flushdb()
+
+        progress = portal.call(warm_up, db_session, cache_pool, 4)
+        # The menu list, the details and submenu lists of both menus,
+        # the submenu and its dish list.
+        assert progress.total == progress.entries == 7
+        assert progress.batches == 2
+        assert progress.finished is not None
+
+        for path, key in keys.items():
+            base = key.split("@")[0]
+            assert cache.hget(key, "body") == responses[path].content
+            assert cache.get(latest_key(base)) == key.encode()
+            response = client.get(path)
+            assert response.content == responses[path].content
+            assert response.headers[ETAG_HEADER] == (
+                responses[path].headers[ETAG_HEADER]
+            )
+
+    def test_warm_up_once(
+        self,
+        portal: BlockingPortal,
+        db_session: AsyncSession,
+        cache_pool: aioredis.Redis,
+        cache: Redis,
+    ):
+        cache.set("lock:warmup", "another worker", ex=5)
+        assert portal.call(warm_up_once, db_session, cache_pool) is None
+        assert cache.exists(versioned_key(MENUS_KEY, [0])) == 0
+
+        cache.delete("lock:warmup")
+        assert portal.call(warm_up_once, db_session, cache_pool).entries == 1
+        assert cache.exists("lock:warmup") == 0
@@ -0,0 +1,135 @@
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+from fastapi import APIRouter
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+QUERIES_HEADER = "X-Debug-Queries"
+REDIS_CALLS_HEADER = "X-Debug-Redis-Calls"
+
+
+@dataclass
+class Call:
+    name: str
+    seconds: float
+
+
+@dataclass
+class Trace:
+    method: str
+    path: str
+    route: str = ""
+    status: int = 500
+    seconds: float = 0
+    queries: list[Call] = field(default_factory=list)
+    redis: list[Call] = field(default_factory=list)
+
+    def describe(self) -> str:
+        return "\n".join(
+            [
+                f"{self.method} {self.path}: {len(self.queries)} queries, "
+                f"{len(self.redis)} redis calls",
+                *(query.name for query in self.queries),
+            ],
+        )
+
+
+current_trace: ContextVar[Trace | None] = ContextVar(
+    "current_trace",
+    default=None,
+)
+# Finished traces, the latest last.
+recent_traces: deque[Trace] = deque(maxlen=settings.DEBUG_REQUESTS_SIZE)
+# Lists collecting the traces finished while capture() is active.
+collectors: list[list[Trace]] = []
+
+
+def trace_redis(command: str, seconds: float) -> None:
+    if (trace := current_trace.get()) is not None:
+        trace.redis.append(Call(command, seconds))
+
+
+def trace_engine(engine: Engine) -> None:
+    """Record the statements of engine in the trace of the request.
+
+    engine is the sync_engine of an async one.
+    """
+    if event.contains(engine, "before_cursor_execute", before_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_execute)
+    event.listen(engine, "after_cursor_execute", after_execute)
+
+
+def before_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, many):
+    started = conn.info["trace_started"].pop()
+    if (trace := current_trace.get()) is not None:
+        trace.queries.append(Call(statement, time.perf_counter() - started))
+
+
+@contextmanager
+def capture() -> Iterator[list[Trace]]:
+    traces: list[Trace] = []
+    collectors.append(traces)
+    try:
+        yield traces
+    finally:
+        collectors.remove(traces)
+
+
+class TracingMiddleware:
+    """Trace the SQL statements and redis calls of every request.
+
+    The counts made before the response starts are sent in the debug
+    headers; the full traces, including background tasks, are kept for
+    GET /debug/requests.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = Trace(scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        started = time.perf_counter()
+
+        async def send_counts(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers[QUERIES_HEADER] = str(len(trace.queries))
+                headers[REDIS_CALLS_HEADER] = str(len(trace.redis))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counts)
+        finally:
+            current_trace.reset(token)
+            trace.seconds = time.perf_counter() - started
+            if (route := scope.get("route")) is not None:
+                trace.route = route.path
+            recent_traces.append(trace)
+            for traces in collectors:
+                traces.append(trace)
+
+
+router = APIRouter()
+
+
+@router.get("/debug/requests", include_in_schema=False)
+async def read_recent_traces():
+    return [asdict(trace) for trace in reversed(recent_traces)]
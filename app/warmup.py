@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import logging
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Any
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, models, schemas
+from app.cache import (
+    MENUS_KEY,
+    MENUS_VERSION,
+    TREE_VERSION,
+    latest_key,
+    menu_key,
+    menu_version,
+    queue_response,
+    release_script,
+    submenu_key,
+    submenu_version,
+    versioned_key,
+)
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.metrics import cache_warmup_entries
+from app.redis import close_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LOCK = "lock:warmup"
+WARMUP_ATTEMPTS = 3
+
+# A cached response: base key, version counters, content and ttl.
+Entry = tuple[str, list[str], Any, int]
+
+
+@dataclass
+class WarmUpProgress:
+    entries: int = 0
+    total: int = 0
+    batches: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+def by_id(rows: list) -> list:
+    # Lists are served in the order of their ids.
+    return sorted(rows, key=lambda row: row.id)
+
+
+def menu_entries(db_menus: list[models.Menu]) -> Iterator[Entry]:
+    """Yield the entries the read routes cache for menus and submenus.
+
+    Lists are the unpaginated variants.
+    """
+    db_menus = by_id(db_menus)
+    yield (
+        MENUS_KEY,
+        [MENUS_VERSION],
+        [schemas.Menu.from_orm(db_menu) for db_menu in db_menus],
+        settings.CACHE_TTL_MENU,
+    )
+    for db_menu in db_menus:
+        versions = [menu_version(db_menu.id)]
+        db_submenus = by_id(db_menu.submenus)
+        yield (
+            menu_key(db_menu.id),
+            versions,
+            schemas.Menu.from_orm(db_menu),
+            settings.CACHE_TTL_MENU,
+        )
+        yield (
+            f"{menu_key(db_menu.id)}:submenus",
+            versions,
+            [
+                schemas.SubMenu.from_orm(db_submenu)
+                for db_submenu in db_submenus
+            ],
+            settings.CACHE_TTL_SUBMENU,
+        )
+        for db_submenu in db_submenus:
+            key = submenu_key(db_menu.id, db_submenu.id)
+            submenu_versions = [
+                *versions,
+                submenu_version(db_menu.id, db_submenu.id),
+            ]
+            yield (
+                key,
+                submenu_versions,
+                schemas.SubMenu.from_orm(db_submenu),
+                settings.CACHE_TTL_SUBMENU,
+            )
+            yield (
+                f"{key}:dishes",
+                submenu_versions,
+                [
+                    schemas.Dish.from_orm(db_dish)
+                    for db_dish in by_id(db_submenu.dishes)
+                ],
+                settings.CACHE_TTL_DISH,
+            )
+
+
+async def load_entries(
+    db: AsyncSession,
+    cache: Redis,
+) -> tuple[list[Entry], dict[str, int]] | None:
+    """Load the catalog and the versions to cache it under.
+
+    Every write bumps TREE_VERSION after its commit, so an unchanged
+    TREE_VERSION around the load means no entry can be cached under a
+    version newer than its data. Returns None when it changed.
+    """
+    before = await cache.get(TREE_VERSION)
+    db.expire_all()
+    entries = list(menu_entries(await crud.get_all_menu_tree(db=db)))
+    names = list(
+        {name: None for _, versions, _, _ in entries for name in versions},
+    )
+    # GETs rather than an MGET, since the versions are in many slots.
+    async with cache.pipeline(transaction=False) as pipe:
+        for name in names:
+            pipe.get(name)
+        pipe.get(TREE_VERSION)
+        *values, after = await pipe.execute()
+    if after != before:
+        return None
+    return entries, {
+        name: int(value or 0) for name, value in zip(names, values)
+    }
+
+
+async def warm_up(
+    db: AsyncSession,
+    cache: Redis,
+    batch_size: int = settings.CACHE_WARMUP_BATCH,
+) -> WarmUpProgress:
+    """Cache the responses of the menu, submenu and dish lists.
+
+    Entries are written in pipelines of batch_size, one round trip each.
+    """
+    progress = WarmUpProgress()
+    for _ in range(WARMUP_ATTEMPTS):
+        loaded = await load_entries(db, cache)
+        if loaded is not None:
+            break
+        logger.info("Cache warm-up: menus changed while loading, retrying")
+    else:
+        logger.warning("Cache warm-up skipped: menus keep changing")
+        return progress
+    entries, current = loaded
+    progress.total = len(entries)
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start : start + batch_size]  # noqa: E203
+        async with cache.pipeline(transaction=False) as pipe:
+            for base, versions, content, ttl in batch:
+                key = versioned_key(base, [current[name] for name in versions])
+                queue_response(
+                    pipe,
+                    key,
+                    content,
+                    ttl=ttl,
+                    latest=latest_key(base),
+                )
+                progress.entries += 1
+            await pipe.execute()
+        cache_warmup_entries.inc(amount=len(batch))
+        progress.batches += 1
+        logger.info(
+            "Cache warm-up: %d/%d entries in %.2fs",
+            progress.entries,
+            progress.total,
+            progress.seconds,
+        )
+    progress.finished = time.monotonic()
+    return progress
+
+
+async def warm_up_once(
+    db: AsyncSession,
+    cache: Redis,
+) -> WarmUpProgress | None:
+    """Warm the cache up unless another worker is doing it."""
+    lock = (WARMUP_LOCK, uuid4().hex)
+    if not await cache.set(*lock, nx=True, ex=settings.CACHE_WARMUP_TIMEOUT):
+        return None
+    try:
+        return await warm_up(db, cache)
+    finally:
+        await release_script(cache, [lock[0]], [lock[1]])
+
+
+async def main(batch_size: int) -> None:
+    try:
+        async with SessionLocal() as db:
+            await warm_up(db, get_redis(), batch_size)
+    finally:
+        await engine.dispose()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогрев кеша меню")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.CACHE_WARMUP_BATCH,
+        help="Количество ключей в одном pipeline",
+    )
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(main(parser.parse_args().batch_size))